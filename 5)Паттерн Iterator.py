@@ -1,13 +1,39 @@
+import base64
+import copy
+import csv
+import heapq
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 
 class Product:
-    def __init__(self, name: str, category: str, price: float, popularity: int):
+    __slots__ = ("name", "category", "price", "popularity", "product_id")
+
+    def __init__(self, name: str, category: str, price: float, popularity: int, product_id: int = None):
         self.name = name
         self.category = category
         self.price = price
         self.popularity = popularity
+        self.product_id = product_id
 
     def __repr__(self):
         return f"{self.name} ({self.category}) - {self.price} руб, популярность: {self.popularity}"
@@ -31,6 +57,375 @@ class CatalogIterator(ABC):
         pass
 
 
+class SortedIndex:
+    """Отсортированный индекс товаров, поддерживаемый при каждом добавлении/удалении.
+
+    Хранится как список отсортированных блоков (до 2 * LOAD элементов): вставка и удаление
+    стоят O(log n + LOAD) вместо сдвига всего списка. Ключ дополняется product_id,
+    поэтому порядок равных ключей совпадает с порядком добавления, как у sorted().
+    После snapshot() списки становятся общими со снимком и копируются при первой записи
+    (copy-on-write): снимок можно обходить без блокировок, пока индекс изменяется.
+    """
+    LOAD = 512
+
+    def __init__(self, key: Callable[[Product], tuple]):
+        self.key = key
+        self._keys: List[List[tuple]] = []
+        self._blocks: List[List[Product]] = []
+        self._maxes: List[tuple] = []
+        self._size = 0
+        # Блоки, созданные после последнего снимка, меняются на месте
+        self._owned = set()
+        self._frozen = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _full_key(self, product: Product) -> tuple:
+        return self.key(product) + (product.product_id,)
+
+    def rebuild(self, products):
+        """Построить индекс целиком одной сортировкой"""
+        products = list(products)
+        keys = list(map(self._full_key, products))
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [[keys[i] for i in order[start:start + self.LOAD]] for start in range(0, len(order), self.LOAD)]
+        self._blocks = [[products[i] for i in order[start:start + self.LOAD]] for start in range(0, len(order), self.LOAD)]
+        self._maxes = [keys[-1] for keys in self._keys]
+        self._size = len(order)
+        self._owned = {id(keys) for keys in self._keys}
+        self._frozen = False
+
+    def snapshot(self) -> "SortedIndex":
+        """Неизменяемый снимок индекса за O(1): общие списки копируются при следующей записи"""
+        snapshot = copy.copy(self)
+        snapshot._owned = set()
+        snapshot._frozen = True
+        self._owned = set()
+        self._frozen = True
+        return snapshot
+
+    def _thaw(self, block: int = None) -> Tuple[List[tuple], List[Product]]:
+        """Подготовить списки к изменению, скопировав те, что разделяются со снимком"""
+        if self._frozen:
+            self._keys, self._blocks, self._maxes = self._keys[:], self._blocks[:], self._maxes[:]
+            self._frozen = False
+        if block is None:
+            return None, None
+        keys = self._keys[block]
+        if id(keys) not in self._owned:
+            keys = self._keys[block] = keys[:]
+            self._blocks[block] = self._blocks[block][:]
+            self._owned.add(id(keys))
+        return keys, self._blocks[block]
+
+    def insert(self, product: Product):
+        key = self._full_key(product)
+        if not self._keys:
+            self._thaw()
+            self._keys.append([key])
+            self._blocks.append([product])
+            self._maxes.append(key)
+            self._owned.add(id(self._keys[0]))
+            self._size = 1
+            return
+        block = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+        keys, products = self._thaw(block)
+        position = bisect_left(keys, key)
+        keys.insert(position, key)
+        products.insert(position, product)
+        self._maxes[block] = keys[-1]
+        self._size += 1
+        if len(keys) > 2 * self.LOAD:
+            self._keys[block:block + 1] = [keys[:self.LOAD], keys[self.LOAD:]]
+            self._blocks[block:block + 1] = [products[:self.LOAD], products[self.LOAD:]]
+            self._maxes[block:block + 1] = [keys[self.LOAD - 1], keys[-1]]
+            self._owned.discard(id(keys))
+            self._owned.update((id(self._keys[block]), id(self._keys[block + 1])))
+
+    def remove(self, product: Product):
+        key = self._full_key(product)
+        block = bisect_left(self._maxes, key)
+        if block < len(self._keys):
+            keys = self._keys[block]
+            position = bisect_left(keys, key)
+            if position < len(keys) and self._blocks[block][position] is product:
+                keys, products = self._thaw(block)
+                del keys[position]
+                del products[position]
+                self._size -= 1
+                if keys:
+                    self._maxes[block] = keys[-1]
+                else:
+                    self._owned.discard(id(keys))
+                    del self._keys[block], self._blocks[block], self._maxes[block]
+                return
+        raise ValueError(f"Товар не найден в индексе: {product.name}")
+
+    @property
+    def blocks(self) -> List[List[Product]]:
+        return self._blocks
+
+    @property
+    def block_keys(self) -> List[List[tuple]]:
+        return self._keys
+
+    def full_key(self, product: Product) -> tuple:
+        return self._full_key(product)
+
+    def _locate(self, key: tuple) -> Tuple[int, int]:
+        block = bisect_left(self._maxes, key)
+        if block == len(self._keys):
+            return block, 0
+        return block, bisect_left(self._keys[block], key)
+
+    def iter_after(self, key: tuple) -> Iterator[Product]:
+        """Товары с ключом строго больше key (key - полный ключ с product_id)"""
+        block = bisect_right(self._maxes, key)
+        if block < len(self._keys):
+            yield from self._blocks[block][bisect_right(self._keys[block], key):]
+            for products in self._blocks[block + 1:]:
+                yield from products
+
+    def items_after(self, key: tuple = None) -> Iterator[Tuple[tuple, Product]]:
+        """Пары (сохраненный полный ключ, товар) с ключом строго больше key; с начала при key=None"""
+        block, position = (bisect_right(self._maxes, key), None) if key is not None else (0, 0)
+        while block < len(self._keys):
+            keys, products = self._keys[block], self._blocks[block]
+            if position is None:
+                position = bisect_right(keys, key)
+            yield from zip(keys[position:], products[position:])
+            block, position = block + 1, 0
+
+    def rank(self, key: tuple) -> int:
+        """Число элементов с ключом меньше key"""
+        block, position = self._locate(key)
+        return sum(len(keys) for keys in self._keys[:block]) + position
+
+    def count_range(self, low: tuple, high: tuple) -> int:
+        return max(0, self.rank(high) - self.rank(low))
+
+    def iter_range(self, low: tuple = None, high: tuple = None) -> Iterator[Product]:
+        """Товары с ключом в [low, high) в порядке индекса"""
+        block, position = self._locate(low) if low is not None else (0, 0)
+        while block < len(self._blocks):
+            keys, products = self._keys[block], self._blocks[block]
+            if high is not None and keys[-1] >= high:
+                yield from products[position:bisect_left(keys, high, position)]
+                return
+            yield from products[position:]
+            block, position = block + 1, 0
+
+
+class IndexCursor(CatalogIterator):
+    """Легкий курсор по постоянному индексу каталога: без копирования и сортировки.
+
+    Обходит снимок индекса (copy-on-write, O(1)), поэтому добавление и удаление товаров
+    во время обхода не сдвигают позицию и не приводят к повторам; как и прежние итераторы
+    с собственной копией списка, курсор видит каталог на момент создания.
+    """
+    def __init__(self, index: SortedIndex):
+        self._sorted_index = index.snapshot()
+        self._block = 0
+        self._offset = 0
+
+    def has_next(self) -> bool:
+        blocks = self._sorted_index.blocks
+        while self._block < len(blocks) and self._offset >= len(blocks[self._block]):
+            self._block += 1
+            self._offset = 0
+        return self._block < len(blocks)
+
+    def next(self) -> Optional[Product]:
+        if not self.has_next():
+            return None
+        product = self._sorted_index.blocks[self._block][self._offset]
+        self._offset += 1
+        return product
+
+    def next_n(self, count: int) -> List[Product]:
+        result = []
+        while len(result) < count and self.has_next():
+            block = self._sorted_index.blocks[self._block]
+            chunk = block[self._offset:self._offset + count - len(result)]
+            result.extend(chunk)
+            self._offset += len(chunk)
+        return result
+
+    def reset(self):
+        self._block = 0
+        self._offset = 0
+
+
+class Vocabulary(SortedIndex):
+    """Отсортированный словарь слов в тех же блоках, что и индекс товаров; ключ - само слово.
+
+    Слова интернируются, чтобы remove() находил сохраненный объект строки.
+    """
+    def __init__(self):
+        super().__init__(lambda token: (token,))
+
+    def _full_key(self, token: str) -> tuple:
+        return (token,)
+
+
+class NameIndex:
+    """Инвертированный индекс слов названий товаров для поиска по префиксу.
+
+    Словарь слов хранится отсортированным, поэтому все слова с данным префиксом - один
+    непрерывный диапазон. Список товаров слова упорядочен по популярности, так что совпадения
+    выдаются сразу ранжированными слиянием списков без сортировки. Редкие слова (артикулы и т. п.)
+    хранят товары простым списком, который меняется на месте; SortedIndex заводится, когда
+    товаров больше SMALL_POSTINGS. Поиск обходит снимки списков, сделанные при вызове search():
+    отданный снимку список копируется при следующей записи в него (copy-on-write, как у SortedIndex),
+    поэтому добавление товаров во время обхода не дает повторов.
+    """
+    TOKEN = re.compile(r"\w+")
+    SMALL_POSTINGS = 64
+
+    def __init__(self, lock: threading.Lock = None):
+        self._vocabulary = Vocabulary()
+        self._postings: Dict[str, Union[List[Product], SortedIndex]] = {}
+        # Слова, простые списки которых отданы снимкам и должны копироваться перед записью
+        self._shared: Set[str] = set()
+        # Блокировка записи владельца индекса: под ней search() снимает согласованные снимки
+        self._lock = lock
+
+    @staticmethod
+    def _rank_key(product: Product) -> tuple:
+        return (-product.popularity,)
+
+    @staticmethod
+    def _full_rank_key(product: Product) -> tuple:
+        return (-product.popularity, product.product_id)
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return cls.TOKEN.findall(text.casefold().replace("ё", "е"))
+
+    def _sorted_postings(self, products: List[Product]) -> Union[List[Product], SortedIndex]:
+        if len(products) > 1:
+            # У большинства слов (артикулы, номера) один товар - сортировать нечего
+            products = sorted(products, key=self._full_rank_key)
+        if len(products) <= self.SMALL_POSTINGS:
+            return products
+        postings = SortedIndex(self._rank_key)
+        postings.rebuild(products)
+        return postings
+
+    def add(self, product: Product):
+        for token in set(self.tokenize(product.name)):
+            postings = self._postings.get(token)
+            if postings is None:
+                token = sys.intern(token)
+                self._postings[token] = [product]
+                self._vocabulary.insert(token)
+            elif isinstance(postings, list):
+                if len(postings) < self.SMALL_POSTINGS:
+                    insort(self._writable(token), product, key=self._full_rank_key)
+                else:
+                    self._shared.discard(token)
+                    self._postings[token] = self._sorted_postings(postings + [product])
+            else:
+                postings.insert(product)
+
+    def _writable(self, token: str) -> List[Product]:
+        """Простой список слова, скопированный, если он отдан снимку"""
+        postings = self._postings[token]
+        if token in self._shared:
+            self._shared.discard(token)
+            postings = self._postings[token] = postings[:]
+        return postings
+
+    def rebuild(self, products: Iterable[Product]):
+        """Построить индекс целиком: группировка по словам и одна сортировка на слово"""
+        grouped: Dict[str, List[Product]] = {}
+        for product in products:
+            for token in set(self.tokenize(product.name)):
+                grouped.setdefault(token, []).append(product)
+        self._postings = {sys.intern(token): self._sorted_postings(matched) for token, matched in grouped.items()}
+        self._shared = set()
+        self._vocabulary.rebuild(self._postings)
+
+    def remove(self, product: Product):
+        for token in set(self.tokenize(product.name)):
+            postings = self._postings[token]
+            if isinstance(postings, list):
+                postings = self._writable(token)
+            postings.remove(product)
+            if not len(postings):
+                del self._postings[token]
+                self._shared.discard(token)
+                self._vocabulary.remove(sys.intern(token))
+
+    def tokens(self, prefix: str) -> List[str]:
+        """Слова словаря, начинающиеся с prefix"""
+        return list(self._vocabulary.iter_range((prefix,), (prefix + "\U0010ffff",)))
+
+    def estimate(self, prefix: str) -> int:
+        return sum(len(self._postings[token]) for token in self.tokens(prefix))
+
+    def _snapshot(self, token: str) -> List[Sequence]:
+        """Товары слова блоками, не меняющимися при последующих записях"""
+        postings = self._postings[token]
+        if isinstance(postings, list):
+            self._shared.add(token)
+            return [postings]
+        return postings.snapshot().blocks
+
+    def ranked(self, prefix: str) -> Iterator[Product]:
+        """Товары со словом на prefix по убыванию популярности, без повторов (по снимку на момент вызова)"""
+        return self._merge([self._snapshot(token) for token in self.tokens(prefix)])
+
+    @classmethod
+    def _merge(cls, postings: List[List[Sequence]]) -> Iterator[Product]:
+        if len(postings) == 1:
+            for products in postings[0]:
+                yield from products
+            return
+        # Слияние кучей из первых элементов; ключ считается только для товара, попадающего в кучу
+        key = cls._full_rank_key
+        heap = [(key(blocks[0][0]), number, 0, 0) for number, blocks in enumerate(postings)]
+        heapq.heapify(heap)
+        previous = None
+        while heap:
+            _, number, block, offset = heap[0]
+            blocks = postings[number]
+            product = blocks[block][offset]
+            offset += 1
+            if offset == len(blocks[block]):
+                block, offset = block + 1, 0
+            if block < len(blocks):
+                heapq.heapreplace(heap, (key(blocks[block][offset]), number, block, offset))
+            else:
+                heapq.heappop(heap)
+            if product is not previous:
+                yield product
+            previous = product
+
+    def search(self, text: str) -> Tuple[Iterator[Product], str]:
+        """Товары, у которых каждое слово запроса - префикс какого-то слова названия; и план"""
+        words = self.tokenize(text)
+        if not words:
+            return iter(()), "пустой запрос"
+        if self._lock is None:
+            return self._search(words)
+        with self._lock:
+            return self._search(words)
+
+    def _search(self, words: List[str]) -> Tuple[Iterator[Product], str]:
+        estimates = {word: self.estimate(word) for word in words}
+        driver = min(words, key=estimates.get)
+        others = [word for word in words if word != driver]
+
+        def matches(product: Product) -> bool:
+            tokens = self.tokenize(product.name)
+            return all(any(token.startswith(word) for token in tokens) for word in others)
+
+        plan = f"слова на '{driver}' (~{estimates[driver]})" + (f", фильтр по {others}" if others else "")
+        return filter(matches, self.ranked(driver)), plan
+
+
 class CategoryIterator(CatalogIterator):
     def __init__(self, products: List[Product]):
         self._products = sorted(products, key=lambda x: x.category)
@@ -115,23 +510,654 @@ class PopularityIterator(CatalogIterator):
         self._index = 0
 
 
+class MappedProductStore:
+    """Хранилище товаров в отображаемом в память колоночном файле.
+
+    Числовые столбцы фиксированной ширины (id, цена, популярность, код категории),
+    строки - в общей куче с массивом смещений; категории закодированы словарем.
+    Для порядков category/price/popularity при построении записываются перестановки
+    строк, поэтому обход в любом порядке не требует сортировки и загрузки в память.
+    Файл только для чтения; для изменений он строится заново методом build().
+    """
+    MAGIC = b"PRODSTO1"
+    SECTIONS = (
+        ("ids", "q"), ("prices", "d"), ("popularity", "q"), ("category_codes", "I"),
+        ("name_offsets", "Q"), ("category_offsets", "Q"),
+        ("order_category", "I"), ("order_price", "I"), ("order_popularity", "I"), ("strings", "B"),
+    )
+    HEADER = struct.Struct("<8sQ" + "QQ" * len(SECTIONS))
+    ORDERS = ("category", "price", "popularity")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, *layout = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"Файл {path} не является хранилищем товаров")
+        self._view = memoryview(self._map)
+        self._columns = {}
+        for (name, code), offset, length in zip(self.SECTIONS, layout[::2], layout[1::2]):
+            self._columns[name] = self._view[offset:offset + length].cast(code)
+        heap, offsets = self._columns["strings"], self._columns["category_offsets"]
+        self._categories = [str(heap[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+
+    def __len__(self) -> int:
+        return self._count
+
+    @classmethod
+    def build(cls, path: str, products: Iterable[Product], chunk: int = 65536) -> "MappedProductStore":
+        """Записать товары в файл потоково: в памяти держатся только буферы и перестановки"""
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.TemporaryDirectory(dir=directory) as spill_directory:
+            spill = {name: open(os.path.join(spill_directory, name), "w+b")
+                     for name in ("ids", "prices", "popularity", "category_codes", "name_offsets", "names")}
+            buffers = {name: array(code) for name, code in cls.SECTIONS[:5]}
+            categories: Dict[str, int] = {}
+            count = names_size = 0
+            for product in products:
+                encoded = product.name.encode("utf-8")
+                buffers["ids"].append(count if product.product_id is None else product.product_id)
+                buffers["prices"].append(product.price)
+                buffers["popularity"].append(product.popularity)
+                buffers["category_codes"].append(categories.setdefault(product.category, len(categories)))
+                buffers["name_offsets"].append(names_size)
+                spill["names"].write(encoded)
+                names_size += len(encoded)
+                count += 1
+                if count % chunk == 0:
+                    cls._flush_buffers(buffers, spill)
+            buffers["name_offsets"].append(names_size)
+            cls._flush_buffers(buffers, spill)
+
+            category_names = list(categories)
+            category_heap = bytearray()
+            category_offsets = array("Q", [names_size])
+            for name in category_names:
+                category_heap += name.encode("utf-8")
+                category_offsets.append(names_size + len(category_heap))
+
+            columns = {}
+            for name, code in cls.SECTIONS[:4]:
+                spill[name].seek(0)
+                columns[name] = array(code, spill[name].read())
+            rank = array("I", [0] * len(category_names))
+            for position, code in enumerate(sorted(range(len(category_names)), key=category_names.__getitem__)):
+                rank[code] = position
+            by_id = sorted(range(count), key=columns["ids"].__getitem__)
+            codes = columns["category_codes"]
+            orders = {
+                "order_category": sorted(by_id, key=lambda row: rank[codes[row]]),
+                "order_price": sorted(by_id, key=columns["prices"].__getitem__),
+                "order_popularity": sorted(by_id, key=columns["popularity"].__getitem__, reverse=True),
+            }
+            del columns, by_id
+
+            sections = {}
+            offset = cls.HEADER.size
+            with open(path, "wb") as output:
+                output.write(bytes(cls.HEADER.size))
+                for name, code in cls.SECTIONS:
+                    output.write(bytes(-offset % 8))
+                    offset += -offset % 8
+                    if name in spill:
+                        spill[name].seek(0)
+                        shutil.copyfileobj(spill[name], output)
+                        length = spill[name].tell()
+                    elif name == "category_offsets":
+                        length = output.write(category_offsets.tobytes())
+                    elif name in orders:
+                        length = output.write(array("I", orders.pop(name)).tobytes())
+                    else:
+                        spill["names"].seek(0)
+                        shutil.copyfileobj(spill["names"], output)
+                        length = spill["names"].tell() + output.write(category_heap)
+                    sections[name] = (offset, length)
+                    offset += length
+                output.seek(0)
+                layout = [value for name, _ in cls.SECTIONS for value in sections[name]]
+                output.write(cls.HEADER.pack(cls.MAGIC, count, *layout))
+            for file in spill.values():
+                file.close()
+        return cls(path)
+
+    @staticmethod
+    def _flush_buffers(buffers: Dict[str, array], spill):
+        for name, buffer in buffers.items():
+            spill[name].write(buffer.tobytes())
+            del buffer[:]
+
+    def column(self, name: str) -> memoryview:
+        """Столбец без копирования: ids, prices, popularity, category_codes"""
+        return self._columns[name]
+
+    def category_name(self, code: int) -> str:
+        return self._categories[code]
+
+    def rows(self, order: str = None) -> Union[memoryview, range]:
+        if order is None:
+            return range(self._count)
+        if order not in self.ORDERS:
+            raise ValueError(f"Неизвестный тип итератора: {order}")
+        return self._columns[f"order_{order}"]
+
+    def product(self, row: int) -> Product:
+        columns = self._columns
+        offsets = columns["name_offsets"]
+        name = str(columns["strings"][offsets[row]:offsets[row + 1]], "utf-8")
+        return Product(name, self._categories[columns["category_codes"][row]], columns["prices"][row],
+                       columns["popularity"][row], columns["ids"][row])
+
+    def iterator(self, order: str = None, page_size: int = 4096) -> "StoreIterator":
+        return StoreIterator(self, order, page_size)
+
+    def close(self):
+        """Закрыть файл; страницы и столбцы, полученные из хранилища, к этому моменту должны быть освобождены"""
+        for column in getattr(self, "_columns", {}).values():
+            column.release()
+        self._columns = {}
+        if hasattr(self, "_view"):
+            self._view.release()
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+
+class ProductPage(Sequence):
+    """Страница товаров из хранилища: срез строк без копирования столбцов.
+
+    Объекты Product создаются только при обращении к элементу. Для страниц в порядке
+    файла column() возвращает срез отображенного файла без копирования; для страниц
+    в порядке category/price/popularity строки переставлены, и столбец собирается
+    в компактный array по перестановке (копия размером со страницу).
+    """
+    def __init__(self, store: MappedProductStore, rows: Union[memoryview, range]):
+        self._store = store
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ProductPage(self._store, self._rows[item])
+        return self._store.product(self._rows[item])
+
+    def column(self, name: str) -> Union[memoryview, array]:
+        values = self._store.column(name)
+        if isinstance(self._rows, range):
+            return values[self._rows.start:self._rows.stop]
+        return array(values.format, map(values.__getitem__, self._rows))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class StoreIterator(CatalogIterator):
+    """Обход хранилища страницами; next_n() возвращает срез ProductPage, а не список"""
+    def __init__(self, store: MappedProductStore, order: str = None, page_size: int = 4096):
+        self._store = store
+        self._rows = store.rows(order)
+        self._page_size = page_size
+        self._position = 0
+
+    def has_next(self) -> bool:
+        return self._position < len(self._rows)
+
+    def next(self) -> Optional[Product]:
+        if not self.has_next():
+            return None
+        self._position += 1
+        return self._store.product(self._rows[self._position - 1])
+
+    def next_n(self, count: int) -> ProductPage:
+        page = ProductPage(self._store, self._rows[self._position:self._position + count])
+        self._position += len(page)
+        return page
+
+    def pages(self) -> Iterator[ProductPage]:
+        while self.has_next():
+            yield self.next_n(self._page_size)
+
+    def reset(self):
+        self._position = 0
+
+
+class QueryIterator(CatalogIterator):
+    """Ленивый результат запроса к каталогу: товары вычисляются по мере обхода"""
+    def __init__(self, source: Callable[[], Iterator[Product]], plan: str):
+        self._source = source
+        self.plan = plan
+        self.reset()
+
+    def _advance(self) -> Optional[Product]:
+        return next(self._iterator, None)
+
+    def has_next(self) -> bool:
+        return self._lookahead is not None
+
+    def next(self) -> Optional[Product]:
+        product = self._lookahead
+        if product is not None:
+            self._lookahead = self._advance()
+        return product
+
+    def next_n(self, count: int) -> List[Product]:
+        result = []
+        while len(result) < count and self._lookahead is not None:
+            result.append(self._lookahead)
+            self._lookahead = self._advance()
+        return result
+
+    def reset(self):
+        self._iterator = self._source()
+        self._lookahead = self._advance()
+
+
+class SearchIterator(QueryIterator):
+    """Результат поиска по названию: совпадения по убыванию популярности, вычисляемые лениво"""
+    def __init__(self, name_index: NameIndex, text: str, limit: int = None):
+        self.text = text
+        self._name_index = name_index
+        self._limit = limit
+        # Первый обход идет по результату того же вызова search(), что дал план
+        self._prepared, plan = name_index.search(text)
+        super().__init__(self._matches, plan)
+
+    def _matches(self) -> Iterator[Product]:
+        matches, self._prepared = self._prepared, None
+        if matches is None:
+            # reset(): новый снимок индекса и план к нему
+            matches, self.plan = self._name_index.search(self.text)
+        return islice(matches, self._limit)
+
+
+class KeysetIterator(CatalogIterator):
+    """Постраничный обход каталога по курсору-токену.
+
+    Состояние обхода целиком в токене cursor (порядок и ключ последнего выданного товара),
+    поэтому продолжить можно в любом потоке или процессе, создав новый итератор с тем же токеном.
+    """
+    def __init__(self, catalog: "Catalog", order: str, cursor: str = None):
+        self._catalog = catalog
+        self._order = order
+        self._start = cursor
+        self.cursor = cursor
+        self._lookahead: List[Product] = []
+        # Ключи заглянутых вперед товаров в снимке, по которым строится следующий курсор
+        self._lookahead_keys: List[tuple] = []
+
+    def has_next(self) -> bool:
+        if not self._lookahead:
+            self._lookahead, self._lookahead_keys = self._catalog._page(self._order, 1, self.cursor)
+        return bool(self._lookahead)
+
+    def next(self) -> Optional[Product]:
+        products = self.next_n(1)
+        return products[0] if products else None
+
+    def next_n(self, count: int) -> List[Product]:
+        if count <= 0:
+            return []
+        result, keys = self._lookahead, self._lookahead_keys
+        self._lookahead, self._lookahead_keys = [], []
+        if len(result) < count:
+            cursor = self._catalog._encode_key(self._order, keys[-1]) if keys else self.cursor
+            products, more_keys = self._catalog._page(self._order, count - len(result), cursor)
+            result += products
+            keys += more_keys
+        if result:
+            self.cursor = self._catalog._encode_key(self._order, keys[-1])
+        return result
+
+    def reset(self):
+        self.cursor = self._start
+        self._lookahead = []
+        self._lookahead_keys = []
+
+
+FEED_FIELDS = ("name", "category", "price", "popularity", "product_id")
+
+
+def _feed_number(value) -> float:
+    return value if isinstance(value, (int, float)) else int(value) if value.isdigit() else float(value)
+
+
+def _parse_feed_chunk(path: str, start: int, end: int, feed_format: str,
+                      fieldnames: List[str]) -> List[Tuple[str, str, float, int, Optional[int]]]:
+    """Разобрать байты [start, end) файла в кортежи полей товара (выполняется в процессе пула)"""
+    with open(path, "rb") as file:
+        file.seek(start)
+        lines = file.read(end - start).decode("utf-8").splitlines()
+    if feed_format == "csv":
+        records = (dict(zip(fieldnames, row)) for row in csv.reader(lines) if row)
+    else:
+        records = (json.loads(line) for line in lines if line.strip())
+    rows = []
+    for record in records:
+        try:
+            product_id = record.get("product_id")
+            rows.append((str(record["name"]), str(record["category"]), _feed_number(record["price"]),
+                         int(record["popularity"]), None if product_id in (None, "") else int(product_id)))
+        except (KeyError, ValueError) as error:
+            raise ValueError(f"Некорректная строка файла {path}: {record} ({error})") from error
+    return rows
+
+
+def _split_feed(path: str, feed_format: str, chunks: int) -> Tuple[List[Tuple[int, int]], List[str]]:
+    """Границы фрагментов файла по концам строк и имена столбцов CSV"""
+    fieldnames: List[str] = []
+    with open(path, "rb") as file:
+        start = 0
+        if feed_format == "csv":
+            header = file.readline()
+            fieldnames = next(csv.reader([header.decode("utf-8-sig")]), [])
+            start = len(header)
+        size = os.fstat(file.fileno()).st_size
+        bounds = [start]
+        for number in range(1, chunks):
+            file.seek(max(start + (size - start) * number // chunks, bounds[-1]))
+            file.readline()
+            bounds.append(min(file.tell(), size))
+        bounds.append(size)
+    return [(low, high) for low, high in zip(bounds, bounds[1:]) if high > low], fieldnames
+
+
 class Catalog:
-    def __init__(self):
-        self._products: List[Product] = []
+    # Типы первого элемента ключа курсора по порядку; второй элемент - номер товара
+    CURSOR_KEY_TYPES = {"category": (str,), "price": (int, float), "popularity": (int,)}
+
+    def __init__(self, store: MappedProductStore = None):
+        self._products: Dict[int, Product] = {}
         self._current_iterator: Optional[CatalogIterator] = None
+        # Каталог поверх файла хранилища: товары не загружаются в память
+        self._store = store
+        self._next_id = 0
+        # Постоянные индексы, обновляемые инкрементально
+        self._indexes = {
+            "category": SortedIndex(lambda product: (product.category,)),
+            "price": SortedIndex(lambda product: (product.price,)),
+            "popularity": SortedIndex(lambda product: (-product.popularity,)),
+        }
+        # Хеш-индекс по категории для фильтрации
+        self._by_category: Dict[str, Dict[int, Product]] = {}
+        # Запись под блокировкой; страницы читаются из снимков индексов без нее
+        self._lock = threading.Lock()
+        # Поиск по словам названий
+        self._names = NameIndex(self._lock)
+        self._version = 0
+        self._snapshots: Dict[str, Tuple[int, SortedIndex]] = {}
+
+    def _require_memory(self, operation: str):
+        """Запросы по индексам есть только у каталога в памяти; хранилище обходится через set_iterator()"""
+        if self._store is not None:
+            raise ValueError(f"{operation}: недоступно для каталога на файле хранилища, используйте set_iterator()")
+
+    def _index_product(self, product: Product):
+        for index in self._indexes.values():
+            index.insert(product)
+        self._by_category.setdefault(product.category, {})[product.product_id] = product
+        self._names.add(product)
+
+    def _unindex_product(self, product: Product):
+        for index in self._indexes.values():
+            index.remove(product)
+        bucket = self._by_category[product.category]
+        del bucket[product.product_id]
+        if not bucket:
+            del self._by_category[product.category]
+        self._names.remove(product)
 
     def add_product(self, product: Product):
-        self._products.append(product)
+        if self._store is not None:
+            raise ValueError("Каталог на файле хранилища доступен только для чтения")
+        with self._lock:
+            if product.product_id is None:
+                product.product_id = self._next_id
+            if product.product_id in self._products:
+                raise ValueError(f"Товар с номером {product.product_id} уже есть в каталоге")
+            self._next_id = max(self._next_id, product.product_id) + 1
+            self._products[product.product_id] = product
+            self._index_product(product)
+            self._version += 1
 
-    def set_iterator(self, iterator_type: str):
-        if iterator_type == "category":
-            self._current_iterator = CategoryIterator(self._products)
-        elif iterator_type == "price":
-            self._current_iterator = PriceIterator(self._products)
-        elif iterator_type == "popularity":
-            self._current_iterator = PopularityIterator(self._products)
+    def bulk_load(self, path: str, workers: int = None, feed_format: str = None) -> int:
+        """Загрузить товары из CSV (с заголовком) или JSONL; возвращает число загруженных товаров.
+
+        Файл делится на фрагменты по строкам, которые разбираются параллельно в пуле процессов;
+        индексы затем строятся одной сортировкой вместо вставки по одному товару.
+        Записи должны занимать ровно одну строку файла.
+        """
+        if self._store is not None:
+            raise ValueError("Каталог на файле хранилища доступен только для чтения")
+        feed_format = feed_format or os.path.splitext(path)[1].lstrip(".").lower()
+        if feed_format not in ("csv", "jsonl"):
+            raise ValueError(f"Неизвестный формат файла: {feed_format}")
+        workers = workers or os.cpu_count() or 1
+        ranges, fieldnames = _split_feed(path, feed_format, workers * 4)
+        arguments = [(path, low, high, feed_format, fieldnames) for low, high in ranges]
+        if workers == 1:
+            parts = [_parse_feed_chunk(*chunk) for chunk in arguments]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                parts = list(pool.map(_parse_feed_chunk, *zip(*arguments)))
+
+        def products() -> Iterator[Product]:
+            parts.reverse()
+            while parts:
+                # Разобранные фрагменты освобождаются по мере создания товаров
+                for row in parts.pop():
+                    yield Product(*row)
+
+        return self.add_products(products())
+
+    def add_products(self, products: Iterable[Product]) -> int:
+        """Добавить товары пачкой; возвращает число добавленных товаров.
+
+        Если пачка сравнима с каталогом, индексы строятся заново одной сортировкой с разбиением
+        на блоки вместо вставки по одному товару. При повторе номера не добавляется ни один товар.
+        """
+        if self._store is not None:
+            raise ValueError("Каталог на файле хранилища доступен только для чтения")
+        with self._lock:
+            loaded: List[Product] = []
+            next_id = self._next_id
+            for product in products:
+                if product.product_id is None:
+                    product.product_id = self._next_id
+                if product.product_id in self._products:
+                    for added in loaded:
+                        del self._products[added.product_id]
+                    self._next_id = next_id
+                    raise ValueError(f"Товар с номером {product.product_id} уже есть в каталоге")
+                self._next_id = max(self._next_id, product.product_id) + 1
+                self._products[product.product_id] = product
+                loaded.append(product)
+            if len(loaded) < len(self._products) // 4:
+                # Небольшая догрузка к большому каталогу: дешевле вставить по одному
+                for product in loaded:
+                    self._index_product(product)
+            else:
+                products = list(self._products.values())
+                for index in self._indexes.values():
+                    index.rebuild(products)
+                self._by_category = {}
+                for product in products:
+                    self._by_category.setdefault(product.category, {})[product.product_id] = product
+                self._names.rebuild(products)
+            self._version += 1
+        return len(loaded)
+
+    def remove_product(self, product: Product):
+        if self._store is not None:
+            raise ValueError("Каталог на файле хранилища доступен только для чтения")
+        with self._lock:
+            self._unindex_product(product)
+            del self._products[product.product_id]
+            self._version += 1
+
+    def update_product(self, product: Product, **fields):
+        """Изменить поля товара (name, category, price, popularity) с перестроением его позиций в индексах"""
+        unknown = set(fields) - {"name", "category", "price", "popularity"}
+        if unknown:
+            raise ValueError(f"Неизвестные поля товара: {sorted(unknown)}")
+        if self._store is not None:
+            raise ValueError("Каталог на файле хранилища доступен только для чтения")
+        with self._lock:
+            self._unindex_product(product)
+            for field, value in fields.items():
+                setattr(product, field, value)
+            self._index_product(product)
+            self._version += 1
+
+    def search(self, text: str, limit: int = None) -> SearchIterator:
+        """Поиск товаров по началу слов названия (автодополнение), самые популярные первыми"""
+        self._require_memory("search")
+        return SearchIterator(self._names, text, limit)
+
+    def snapshot(self, order: str) -> Tuple[int, SortedIndex]:
+        """Версия каталога и согласованный снимок индекса order (один на версию)"""
+        self._require_memory("snapshot")
+        if order not in self._indexes:
+            raise ValueError(f"Неизвестный тип итератора: {order}")
+        with self._lock:
+            return self._snapshot(order)
+
+    def _snapshot(self, order: str) -> Tuple[int, SortedIndex]:
+        """snapshot() под уже взятой блокировкой записи"""
+        cached = self._snapshots.get(order)
+        if cached is None or cached[0] != self._version:
+            cached = self._snapshots[order] = (self._version, self._indexes[order].snapshot())
+        return cached
+
+    def encode_cursor(self, order: str, product: Product) -> str:
+        """Непрозрачный токен позиции после product в порядке order"""
+        return self._encode_key(order, self._indexes[order].full_key(product))
+
+    @staticmethod
+    def _encode_key(order: str, key: tuple) -> str:
+        return base64.urlsafe_b64encode(json.dumps([order, key], ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> Tuple[str, tuple]:
+        try:
+            order, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            key = tuple(key)
+        except (ValueError, TypeError) as error:
+            raise ValueError(f"Некорректный курсор: {cursor!r}") from error
+        # Ключ сравнивается с ключами индекса, поэтому его форма должна совпадать с порядком
+        types = cls.CURSOR_KEY_TYPES.get(order) if isinstance(order, str) else None
+        if (types is None or len(key) != 2 or any(isinstance(value, bool) for value in key)
+                or not isinstance(key[0], types) or not isinstance(key[1], int)):
+            raise ValueError(f"Некорректный курсор: {cursor!r}")
+        return order, key
+
+    def page(self, order: str, count: int, cursor: str = None) -> Tuple[List[Product], Optional[str]]:
+        """Страница из count товаров после позиции cursor и токен следующей страницы (None в конце).
+
+        Страница читается из снимка индекса: добавление товаров в других потоках не приводит
+        к пропускам и повторам уже существовавших товаров между страницами.
+        """
+        products, keys = self._page(order, count + 1, cursor)
+        if len(products) <= count:
+            return products, None
+        return products[:count], self._encode_key(order, keys[count - 1])
+
+    def _page(self, order: str, count: int, cursor: str = None) -> Tuple[List[Product], List[tuple]]:
+        """До count товаров после cursor и их ключи из снимка индекса.
+
+        Курсор строится из ключа, сохраненного в снимке: update_product() меняет товар на месте,
+        и ключ, пересчитанный по живому объекту, указывал бы на его новую позицию.
+        """
+        self._require_memory("page")
+        _, index = self.snapshot(order)
+        key = None
+        if cursor is not None:
+            cursor_order, key = self.decode_cursor(cursor)
+            if cursor_order != order:
+                raise ValueError(f"Курсор для порядка {cursor_order}, а запрошен {order}")
+        items = list(islice(index.items_after(key), count))
+        return [product for _, product in items], [key for key, _ in items]
+
+    def paginate(self, order: str, cursor: str = None) -> KeysetIterator:
+        self._require_memory("paginate")
+        return KeysetIterator(self, order, cursor)
+
+    def query(self, category: str = None, price_range: Tuple[float, float] = None, min_popularity: int = None,
+              order_by: str = None, limit: int = None) -> QueryIterator:
+        """Отбор товаров по критериям с выбором самого избирательного индекса.
+
+        order_by: "category", "price" (по возрастанию), "popularity" (по убыванию) или None.
+        Результат - ленивый итератор по снимкам индексов на момент вызова (как у page()), поэтому
+        изменения каталога во время обхода его не затрагивают; план доступен в атрибуте plan.
+        """
+        self._require_memory("query")
+        if order_by is not None and order_by not in self._indexes:
+            raise ValueError(f"Неизвестный порядок сортировки: {order_by}")
+        # Снимки всех индексов и размер категории - за одно взятие блокировки, чтобы оценки
+        # и обход относились к одной версии каталога; дальше работа идет только со снимками
+        with self._lock:
+            indexes = {order: self._snapshot(order)[1] for order in self._indexes}
+            in_category = len(self._by_category.get(category, ())) if category is not None else 0
+        total = len(indexes["category"])
+        category_bounds = price_bounds = popularity_high = None
+        estimates = {"scan": total}
+        if category is not None:
+            # Оценка по хеш-индексу за O(1); обход - по диапазону отсортированного индекса категорий
+            category_bounds = ((category,), (category, math.inf))
+            estimates["category"] = in_category
+        if price_range is not None:
+            price_bounds = ((price_range[0],), (price_range[1], math.inf))
+            estimates["price"] = indexes["price"].count_range(*price_bounds)
+        if min_popularity is not None:
+            popularity_high = (-min_popularity, math.inf)
+            estimates["popularity"] = indexes["popularity"].rank(popularity_high)
+        driver = min(estimates, key=estimates.get)
+
+        def matches(product: Product) -> bool:
+            return ((category is None or product.category == category)
+                    and (price_range is None or price_range[0] <= product.price <= price_range[1])
+                    and (min_popularity is None or product.popularity >= min_popularity))
+
+        def scan(source: str) -> Iterator[Product]:
+            if source == "category" and category_bounds is not None:
+                products = indexes["category"].iter_range(*category_bounds)
+            elif source == "price" and price_bounds is not None:
+                products = indexes["price"].iter_range(*price_bounds)
+            elif source == "popularity" and popularity_high is not None:
+                products = indexes["popularity"].iter_range(None, popularity_high)
+            else:
+                products = indexes[source if source in indexes else "category"].iter_range()
+            return filter(matches, products)
+
+        matched = estimates[driver]
+        if order_by is None or order_by == driver:
+            plan = f"индекс {driver} (~{matched})"
+            source = lambda: islice(scan(driver), limit)
+        elif limit is not None and limit * total / max(matched, 1) < matched:
+            # Мало нужных строк: обходим индекс сортировки и фильтруем до limit совпадений
+            plan = f"обход индекса {order_by} с фильтром до {limit} (~{matched} совпадений)"
+            source = lambda: islice(scan(order_by), limit)
         else:
-            raise ValueError(f"Неизвестный тип итератора: {iterator_type}")
+            key = indexes[order_by].full_key
+            if limit is not None:
+                plan = f"индекс {driver} (~{matched}), top-{limit} по {order_by} кучей"
+                source = lambda: iter(heapq.nsmallest(limit, scan(driver), key=key))
+            else:
+                plan = f"индекс {driver} (~{matched}), сортировка по {order_by}"
+                source = lambda: iter(sorted(scan(driver), key=key))
+        return QueryIterator(source, plan)
+
+    def set_iterator(self, iterator_type: str):
+        if self._store is not None:
+            self._current_iterator = self._store.iterator(iterator_type)
+            return
+        # Итераторы каталога - курсоры по снимкам индексов, поддерживаемых в add_product()
+        self._current_iterator = IndexCursor(self.snapshot(iterator_type)[1])
 
     def has_next(self) -> bool:
         if self._current_iterator is None:
@@ -152,6 +1178,285 @@ class Catalog:
         if self._current_iterator:
             self._current_iterator.reset()
 
+def benchmark_iterators(count: int = 200000, requests: int = 20):
+    """Сортировка на каждый запрос против курсора по постоянному индексу"""
+    generator = random.Random(1)
+    products = [Product(f"Товар {i}", f"Категория {i % 50}", generator.randint(100, 100000), generator.randint(1, 10), i)
+                for i in range(count)]
+    catalog = Catalog()
+    start = time.perf_counter()
+    catalog.add_products(products)
+    build = time.perf_counter() - start
+    # Догрузка по одному товару в построенный каталог
+    extra = [Product(f"Новый {i}", f"Категория {i % 50}", generator.randint(100, 100000), generator.randint(1, 10))
+             for i in range(1000)]
+    start = time.perf_counter()
+    for product in extra:
+        catalog.add_product(product)
+    insert = (time.perf_counter() - start) / len(extra)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        PriceIterator(products).next_n(20)
+    sorting = (time.perf_counter() - start) / requests
+    start = time.perf_counter()
+    for _ in range(requests):
+        catalog.set_iterator("price")
+        catalog.next_n(20)
+    cursor = (time.perf_counter() - start) / requests
+    print(f"{count} товаров: построение индексов {build:.2f} с, вставка по одному {insert * 1e6:.0f} мкс, "
+          f"первая страница по цене: "
+          f"сортировка {sorting * 1000:.1f} мс, курсор по индексу {cursor * 1e6:.1f} мкс")
+    return sorting, cursor
+
+def benchmark_query(count: int = 200000, repeats: int = 20):
+    """Запросы через индексы и планировщик против фильтрации и сортировки всего списка"""
+    generator = random.Random(2)
+    catalog = Catalog()
+    catalog.add_products(Product(f"Товар {i}", f"Категория {i % 200}", generator.randint(100, 100000),
+                                 generator.randint(1, 1000), i) for i in range(count))
+    products = list(catalog._products.values())
+    queries = [
+        dict(category="Категория 7", order_by="price", limit=20),
+        dict(price_range=(1000, 1500), order_by="popularity", limit=10),
+        dict(min_popularity=990, category="Категория 3"),
+        dict(price_range=(100, 90000), order_by="popularity", limit=10),
+    ]
+    for criteria in queries:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            result = catalog.query(**criteria)
+            indexed = result.next_n(criteria.get("limit") or count)
+        indexed_time = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            naive = [p for p in products
+                     if ("category" not in criteria or p.category == criteria["category"])
+                     and ("price_range" not in criteria or criteria["price_range"][0] <= p.price <= criteria["price_range"][1])
+                     and ("min_popularity" not in criteria or p.popularity >= criteria["min_popularity"])]
+            if "order_by" in criteria:
+                naive.sort(key=catalog._indexes[criteria["order_by"]].full_key)
+            naive = naive[:criteria.get("limit")]
+        naive_time = (time.perf_counter() - start) / repeats
+        assert [p.product_id for p in indexed] == [p.product_id for p in naive]
+        print(f"{result.plan}: {indexed_time * 1000:.2f} мс против {naive_time * 1000:.1f} мс")
+
+def benchmark_store(count: int = 200000, page_size: int = 4096):
+    """Каталог в памяти против файла хранилища: память, открытие и постраничный обход"""
+    generator = random.Random(3)
+    products = (Product(f"Товар {i}", f"Категория {i % 100}", generator.randint(100, 100000),
+                        generator.randint(1, 10), i) for i in range(count))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "products.bin")
+        start = time.perf_counter()
+        MappedProductStore.build(path, products).close()
+        build = time.perf_counter() - start
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = MappedProductStore(path)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        total = 0.0
+        for page in store.iterator(None, page_size).pages():
+            total += sum(page.column("prices"))
+        scanned = time.perf_counter() - start
+        # В порядке цены столбец страницы собирается по перестановке строк
+        start = time.perf_counter()
+        for page in store.iterator("price", page_size).pages():
+            total -= sum(page.column("prices"))
+        paged = time.perf_counter() - start
+        del page
+        store_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = os.path.getsize(path)
+
+        generator.seed(3)
+        tracemalloc.start()
+        catalog = Catalog()
+        catalog.add_products(Product(f"Товар {i}", f"Категория {i % 100}", generator.randint(100, 100000),
+                                     generator.randint(1, 10), i) for i in range(count))
+        catalog_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        store.close()
+    print(f"{count} товаров: файл {size / 2 ** 20:.1f} МБ построен за {build:.2f} с, открыт за {opened * 1000:.2f} мс; "
+          f"обход страницами: в порядке файла без копирования {scanned:.2f} с, по цене со сборкой столбца {paged:.2f} с "
+          f"(расхождение сумм {total:.0f}), память кучи {store_memory / 2 ** 20:.1f} МБ "
+          f"против {catalog_memory / 2 ** 20:.0f} МБ у каталога в памяти")
+
+def benchmark_search(count: int = 200000, limit: int = 10):
+    """Автодополнение по индексу слов против линейного обхода каталога"""
+    generator = random.Random(6)
+    syllables = ["ка", "ро", "ми", "ло", "те", "на", "ви", "зо", "пу", "ле", "ша", "ту"]
+    words = sorted({"".join(generator.choices(syllables, k=generator.randint(2, 4))) for _ in range(5000)})
+    catalog = Catalog()
+    start = time.perf_counter()
+    catalog.add_products(Product(" ".join(generator.choices(words, k=3)), f"Категория {i % 50}",
+                                 generator.randint(100, 100000), generator.randint(1, 1000), i) for i in range(count))
+    build = time.perf_counter() - start
+    products = list(catalog._products.values())
+    for text in ("ка", "ромила", "ми ту", "лотена"):
+        start = time.perf_counter()
+        for _ in range(20):
+            result = catalog.search(text, limit)
+            found = result.next_n(limit)
+        indexed = (time.perf_counter() - start) / 20
+        start = time.perf_counter()
+        prefixes = NameIndex.tokenize(text)
+        naive = sorted((p for p in products
+                        if all(any(token.startswith(prefix) for token in NameIndex.tokenize(p.name)) for prefix in prefixes)),
+                       key=lambda p: (-p.popularity, p.product_id))[:limit]
+        linear = time.perf_counter() - start
+        assert [p.product_id for p in found] == [p.product_id for p in naive]
+        print(f"'{text}': {result.plan}, top-{limit} за {indexed * 1000:.3f} мс против {linear * 1000:.0f} мс обходом")
+    print(f"{count} товаров с индексом слов добавлены за {build:.2f} с")
+
+def _peak_rss() -> int:
+    """Пиковый RSS текущего процесса в КБ: PeakWorkingSetSize в Windows, VmHWM в Linux.
+
+    Оба счетчика относятся к самому процессу, а не наследуются от родителя, как ru_maxrss
+    у процесса, запущенного через fork/exec; ru_maxrss остается запасным вариантом.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.WinDLL("kernel32")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        get_info = kernel32.K32GetProcessMemoryInfo
+        get_info.argtypes = (wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD)
+        if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            raise ctypes.WinError()
+        return counters.PeakWorkingSetSize // 1024
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в остальных системах - в КБ
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def _measure_load(path: str, method: str) -> Tuple[float, int, int]:
+    """Время загрузки и прирост пикового RSS (КБ) в отдельном процессе"""
+    baseline = _peak_rss()
+    catalog = Catalog()
+    start = time.perf_counter()
+    if method == "bulk_load":
+        catalog.bulk_load(path)
+    else:
+        with open(path, encoding="utf-8", newline="") as file:
+            for record in csv.DictReader(file):
+                catalog.add_product(Product(record["name"], record["category"], _feed_number(record["price"]),
+                                            int(record["popularity"]), int(record["product_id"])))
+    elapsed = time.perf_counter() - start
+    return elapsed, len(catalog._products), _peak_rss() - baseline
+
+def benchmark_bulk_load(count: int = 200000):
+    """Загрузка CSV: bulk_load против цикла add_product; строк в секунду и прирост пикового RSS"""
+    generator = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "products.csv")
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(FEED_FIELDS)
+            for i in range(count):
+                writer.writerow((f"Товар {generator.randint(1, 5000)} серия {i % 97}", f"Категория {i % 100}",
+                                 generator.randint(100, 100000), generator.randint(1, 10), i))
+        for method in ("add_product", "bulk_load"):
+            # Каждый способ - в новом чистом процессе, чтобы пиковый RSS не смешивался
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                elapsed, rows, peak = pool.submit(_measure_load, path, method).result()
+            print(f"{method}: {rows} строк за {elapsed:.2f} с ({rows / elapsed:.0f} строк/с), "
+                  f"пиковый RSS +{peak / 1024:.0f} МБ")
+
+def stress_keyset_pagination(initial: int = 20000, writers: int = 4, adds_per_writer: int = 5000,
+                             readers: int = 8, page_size: int = 50):
+    """Параллельная постраничная выдача при добавлении товаров: проверка согласованности и пропускная способность.
+
+    Читатели передают токен друг другу через общую очередь, как HTTP-запросы разным обработчикам.
+    Каждый проход должен быть строго упорядочен и содержать все товары, бывшие в каталоге до его начала.
+    """
+    generator = random.Random(4)
+    catalog = Catalog()
+    catalog.add_products(Product(f"Товар {i}", f"Категория {i % 50}", generator.randint(100, 100000),
+                                 generator.randint(1, 10)) for i in range(initial))
+    tokens: List[Tuple[int, Optional[str]]] = [(walk, None) for walk in range(readers * 4)]
+    seen: Dict[int, List[tuple]] = {walk: [] for walk in range(readers * 4)}
+    existing = {walk: None for walk in seen}
+    tokens_lock = threading.Lock()
+    pages = 0
+    key = catalog._indexes["price"].full_key
+
+    def write(seed: int):
+        local = random.Random(seed)
+        for i in range(adds_per_writer):
+            catalog.add_product(Product(f"Новый {seed}-{i}", "Новинки", local.randint(100, 100000), local.randint(1, 10)))
+
+    def read():
+        nonlocal pages
+        while True:
+            with tokens_lock:
+                if not tokens:
+                    return
+                walk, cursor = tokens.pop(0)
+                if existing[walk] is None:
+                    existing[walk] = {product.product_id for product in catalog.snapshot("price")[1].iter_range()}
+            products, cursor = catalog.page("price", page_size, cursor)
+            with tokens_lock:
+                seen[walk].extend(key(product) for product in products)
+                pages += 1
+                if cursor is not None:
+                    tokens.append((walk, cursor))
+
+    threads = [threading.Thread(target=write, args=(seed,)) for seed in range(writers)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for walk, keys in seen.items():
+        assert all(a < b for a, b in zip(keys, keys[1:])), "Повтор или нарушение порядка между страницами"
+        assert existing[walk] <= {product_id for *_, product_id in keys}, "Пропущен существовавший товар"
+    assert len(catalog._products) == initial + writers * adds_per_writer
+    print(f"{readers} читателей и {writers} писателей: {pages} страниц по {page_size} за {elapsed:.2f} с "
+          f"({pages / elapsed:.0f} страниц/с) при {writers * adds_per_writer / elapsed:.0f} добавлений/с, "
+          f"проходов без пропусков и повторов: {len(seen)}")
+    return pages / elapsed
+
+def benchmark_pagination(count: int = 200000, pages: int = 2000, page_size: int = 20):
+    """Глубокая страница: курсор-токен против нового итератора со смещением"""
+    generator = random.Random(5)
+    catalog = Catalog()
+    catalog.add_products(Product(f"Товар {i}", f"Категория {i % 50}", generator.randint(100, 100000),
+                                 generator.randint(1, 10)) for i in range(count))
+    start = time.perf_counter()
+    cursor = None
+    for _ in range(pages):
+        _, cursor = catalog.page("price", page_size, cursor)
+    keyset = (time.perf_counter() - start) / pages
+    start = time.perf_counter()
+    for number in range(0, pages, 100):
+        catalog.set_iterator("price")
+        catalog.next_n(number * page_size)
+        catalog.next_n(page_size)
+    offset = (time.perf_counter() - start) / len(range(0, pages, 100))
+    print(f"{count} товаров, страницы по {page_size}: курсор-токен {keyset * 1e6:.0f} мкс на страницу, "
+          f"смещение в среднем {offset * 1e6:.0f} мкс на страницу")
+
 if __name__ == "__main__":
     catalog = Catalog()
 
@@ -182,6 +1487,47 @@ if __name__ == "__main__":
     while catalog.has_next():
         print(catalog.next())
 
+    print("\nИзменение цены и удаление товара обновляют индексы:")
+    catalog.set_iterator("price")
+    cheapest = catalog.next()
+    catalog.update_product(cheapest, price=99999)
+    catalog.set_iterator("price")
+    print(catalog.next_n(2))
+    catalog.remove_product(cheapest)
+
+    print("\nЗапрос: электроника дешевле 30000, по популярности:")
+    electronics = catalog.query(category="Электроника", price_range=(0, 30000), order_by="popularity")
+    while electronics.has_next():
+        print(electronics.next())
+    print(f"План: {electronics.plan}")
+
+    print("\nКаталог поверх файла хранилища, первые 2 по цене:")
+    with tempfile.TemporaryDirectory() as directory:
+        store = MappedProductStore.build(os.path.join(directory, "products.bin"), catalog.query().next_n(100))
+        mapped_catalog = Catalog(store)
+        mapped_catalog.set_iterator("price")
+        page = mapped_catalog.next_n(2)
+        print(page, "цены:", page.column("prices"))
+        del page, mapped_catalog
+        store.close()
+
+    print("\nПоиск по началу слова 'смарт':")
+    print(catalog.search("смарт").next_n(5))
+
+    print("\nПостраничная выдача по курсору-токену (по 2 товара по цене):")
+    first_page, token = catalog.page("price", 2)
+    print(first_page, "следующий курсор:", token)
+    print(catalog.paginate("price", token).next_n(2))
+
+    print()
+    benchmark_iterators()
+    benchmark_query()
+    benchmark_store()
+    benchmark_pagination()
+    benchmark_search()
+    benchmark_bulk_load()
+    stress_keyset_pagination()
+
 '''
 При обработке ситуации, когда в каталоге нет товаров, соответствующих критерию:
    - Все итераторы корректно работают с пустыми списками товаров - методы has_next() сразу возвращают False.
@@ -1,69 +1,441 @@
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
 
 
 class OrderState(ABC):
-    @abstractmethod
+    """Состояние заказа - разделяемый объект-приспособленец (flyweight).
+
+    У состояний нет собственных данных, поэтому каждый класс существует в одном экземпляре:
+    повторный вызов конструктора возвращает тот же объект. Переходы описаны таблицей TRANSITIONS.
+    """
+    code: int = None
+    _instances: Dict[type, "OrderState"] = {}
+
+    def __new__(cls):
+        instance = OrderState._instances.get(cls)
+        if instance is None:
+            instance = OrderState._instances[cls] = super().__new__(cls)
+        return instance
+
     def process_order(self, order):
-        pass
+        order.set_state(TRANSITIONS["process"][self])
+        self._report(order, f"Заказ переведен в состояние: {order.get_status()}")
 
     @abstractmethod
     def get_status(self):
         pass
 
+    @staticmethod
+    def _report(order, message: str):
+        if order.verbose:
+            print(message)
 
-class NewState(OrderState):
 
-    def process_order(self, order):
-        order.set_state(ProcessingState())
-        print("Заказ переведен в состояние: В обработке")
+class NewState(OrderState):
+    code = 0
 
     def get_status(self):
         return "Новый"
 
 
 class ProcessingState(OrderState):
-
-    def process_order(self, order):
-        order.set_state(ShippedState())
-        print("Заказ переведен в состояние: Отправлен")
+    code = 1
 
     def get_status(self):
         return "В обработке"
 
 
 class ShippedState(OrderState):
-
-    def process_order(self, order):
-        order.set_state(DeliveredState())
-        print("Заказ переведен в состояние: Доставлен")
+    code = 2
 
     def get_status(self):
         return "Отправлен"
 
 
 class DeliveredState(OrderState):
+    code = 3
+
     def process_order(self, order):
-        print("Заказ уже доставлен. Дальнейшие изменения невозможны")
+        self._report(order, "Заказ уже доставлен. Дальнейшие изменения невозможны")
 
     def get_status(self):
         return "Доставлен"
 
 
 class CancelledState(OrderState):
+    code = 4
+
     def process_order(self, order):
-        print("Заказ отменен. Дальнейшие изменения невозможны")
+        self._report(order, "Заказ отменен. Дальнейшие изменения невозможны")
 
     def get_status(self):
         return "Отменен"
 
 
-class Order:
+# Состояния по коду и таблица допустимых переходов: событие -> {из состояния: в состояние}
+STATES = (NewState(), ProcessingState(), ShippedState(), DeliveredState(), CancelledState())
+TRANSITIONS: Dict[str, Dict[OrderState, OrderState]] = {
+    "process": {NewState(): ProcessingState(), ProcessingState(): ShippedState(), ShippedState(): DeliveredState()},
+    "cancel": {NewState(): CancelledState(), ProcessingState(): CancelledState()},
+}
+MASK_FLAG = 8
+
+
+def _translation_tables(event: str):
+    """Таблицы для bytes.translate: переход всех кодов и переход только отмеченных флагом MASK_FLAG"""
+    moves = {state.code: target.code for state, target in TRANSITIONS[event].items()}
+    everything = bytes(moves.get(code, code) for code in range(256))
+    masked = bytes(moves.get(value & ~MASK_FLAG, value & ~MASK_FLAG) if value & MASK_FLAG else value
+                   for value in range(256))
+    return everything, masked, moves
+
+
+_TABLES = {event: _translation_tables(event) for event in TRANSITIONS}
+_MASK_FLAGS = bytes([0] + [MASK_FLAG] * 255)
+_BY_STATUS = {state.get_status(): state for state in STATES}
+# Байты плотного массива OrderStateLog (код + 1) обратно в коды состояний
+_UNSHIFT = bytes((value - 1) % 256 for value in range(256))
+# Конечные состояния - без исходящих переходов ни по одному событию
+TERMINAL_STATES = frozenset(state for state in STATES
+                            if not any(state in moves for moves in TRANSITIONS.values()))
+
+
+def state_for(status: Union[str, OrderState]) -> OrderState:
+    """Состояние по названию статуса ("Отправлен") или само состояние"""
+    if isinstance(status, OrderState):
+        return status
+    state = _BY_STATUS.get(status)
+    if state is None:
+        raise ValueError(f"Неизвестный статус заказа: {status}")
+    return state
+
+
+class StateOccupancy:
+    """Живые счетчики и списки заказов по состояниям, обновляемые в Order.set_state().
+
+    count() и counts() - O(1), orders() - O(k) по числу заказов в состоянии, без обхода всех заказов.
+    Заказы в конечных состояниях (TERMINAL_STATES) больше не меняются, поэтому для них хранится
+    только число: доставленные и отмененные заказы не удерживаются в памяти учетом.
+    Дополнительно считаются переходы (из, в) для панелей мониторинга.
+    """
     def __init__(self):
+        self._buckets: Tuple[Optional[Dict["Order", None]], ...] = tuple(
+            None if state in TERMINAL_STATES else {} for state in STATES)
+        self._counts = [0] * len(STATES)
+        # Счетчики переходов в плоском списке по индексу source.code * len(STATES) + target.code
+        self._transitions = [0] * len(STATES) ** 2
+        self._lock = threading.Lock()
+
+    def _add(self, order: "Order", state: OrderState):
+        bucket = self._buckets[state.code]
+        if bucket is not None:
+            bucket[order] = None
+        self._counts[state.code] += 1
+
+    def _remove(self, order: "Order", state: OrderState):
+        bucket = self._buckets[state.code]
+        if bucket is not None:
+            del bucket[order]
+        self._counts[state.code] -= 1
+
+    def track(self, order: "Order"):
+        with self._lock:
+            self._add(order, order._state)
+
+    def untrack(self, order: "Order"):
+        with self._lock:
+            self._remove(order, order._state)
+
+    def move(self, order: "Order", source: OrderState, target: OrderState):
+        with self._lock:
+            self._remove(order, source)
+            self._add(order, target)
+            self._transitions[source.code * len(STATES) + target.code] += 1
+
+    @property
+    def transitions(self) -> Dict[Tuple[str, str], int]:
+        """Ненулевые счетчики переходов по парам статусов (из, в)"""
+        return {(source.get_status(), target.get_status()): self._transitions[source.code * len(STATES) + target.code]
+                for source in STATES for target in STATES
+                if self._transitions[source.code * len(STATES) + target.code]}
+
+    def count(self, status: Union[str, OrderState]) -> int:
+        return self._counts[state_for(status).code]
+
+    def counts(self) -> Dict[str, int]:
+        return {state.get_status(): self._counts[state.code] for state in STATES}
+
+    def orders(self, status: Union[str, OrderState]) -> List["Order"]:
+        state = state_for(status)
+        if state in TERMINAL_STATES:
+            raise ValueError(f"Заказы в конечном состоянии '{state.get_status()}' не хранятся, доступно только их число")
+        with self._lock:
+            return list(self._buckets[state.code])
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {"states": self.counts(),
+                    "transitions": {f"{source} -> {target}": count for (source, target), count in self.transitions.items()}}
+
+    def to_prometheus(self, name: str = "orders") -> str:
+        """Экспорт счетчиков в текстовом формате Prometheus"""
+        lines = [f"# HELP {name}_in_state Число заказов в состоянии", f"# TYPE {name}_in_state gauge"]
+        with self._lock:
+            for status, count in self.counts().items():
+                lines.append(f'{name}_in_state{{state="{status}"}} {count}')
+            lines += [f"# HELP {name}_transitions_total Число переходов между состояниями",
+                      f"# TYPE {name}_transitions_total counter"]
+            for (source, target), count in sorted(self.transitions.items()):
+                lines.append(f'{name}_transitions_total{{from="{source}",to="{target}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class OrderStateLog:
+    """Журнал переходов состояний заказов только на дозапись, со снимками и быстрым восстановлением.
+
+    Записи (order_id, из, в, время) фиксированной длины копятся в буфере и передаются ОС
+    в transitions.log одной записью на группу: каждые group_size записей (вместе с fsync
+    при sync=True) и не позже commit_interval секунд после предыдущей передачи (фоновым потоком),
+    поэтому падение процесса теряет не больше последних commit_interval секунд переходов.
+    Текущие коды состояний хранятся по байту на заказ в bytearray по номеру заказа;
+    номера далеко за концом массива (разреженные) - в словаре. Каждые snapshot_every записей
+    оба хранилища атомарно сохраняются в snapshot.bin вместе со смещением журнала. При открытии
+    каталога состояние восстанавливается из последнего снимка и хвоста журнала после него;
+    неполная последняя запись (обрыв при сбое) отбрасывается.
+    """
+    RECORD = struct.Struct("<QdBB6x")
+    SNAPSHOT_MAGIC = b"ORDSNAP3"
+    # Сигнатура, смещение журнала, длина плотного массива, число разреженных номеров
+    SNAPSHOT_HEADER = struct.Struct("<8sQQQ")
+    # Номер попадает в плотный массив, если он не дальше этого запаса за удвоенной длиной массива
+    DENSE_SLACK = 65536
+
+    def __init__(self, directory: str, snapshot_every: int = 1000000, group_size: int = 4096, sync: bool = False,
+                 commit_interval: float = 0.01):
+        if snapshot_every < 1 or group_size < 1:
+            raise ValueError("Интервал снимков и размер группы должны быть положительными")
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.group_size = group_size
+        self.sync = sync
+        self.commit_interval = commit_interval
+        self.snapshots = 0
+        self._lock = threading.Condition()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        self._log_path = os.path.join(directory, "transitions.log")
+        self._snapshot_path = os.path.join(directory, "snapshot.bin")
+        os.makedirs(directory, exist_ok=True)
+        # Код состояния + 1 по номеру заказа (0 - заказ журналу неизвестен) и разреженные номера
+        self._dense = bytearray()
+        self._sparse: Dict[int, int] = {}
+        self._snapshot_offset, self.replayed = self._recover()
+        self._file = open(self._log_path, "ab")
+        self._file.truncate(self._snapshot_offset + self.replayed * self.RECORD.size)
+        self._buffer = bytearray()
+        self._pending = 0
+        self._since_snapshot = self.replayed
+        self._last_flush = time.monotonic()
+
+    def _recover(self) -> Tuple[int, int]:
+        offset = 0
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as file:
+                magic, offset, dense, sparse = self.SNAPSHOT_HEADER.unpack(file.read(self.SNAPSHOT_HEADER.size))
+                if magic != self.SNAPSHOT_MAGIC:
+                    raise ValueError(f"Файл {self._snapshot_path} не является снимком состояний")
+                self._dense = bytearray(file.read(dense))
+                order_ids = array("Q")
+                order_ids.frombytes(file.read(sparse * order_ids.itemsize))
+                self._sparse = dict(zip(order_ids, file.read(sparse)))
+        size = os.path.getsize(self._log_path) if os.path.exists(self._log_path) else 0
+        if size < offset:
+            # Дополнение журнала нулями при усечении дало бы записи "заказ 0 -> Новый"
+            raise ValueError(f"Журнал {self._log_path} короче смещения снимка ({size} < {offset} байт)")
+        if not size:
+            return 0, 0
+        with open(self._log_path, "rb") as file:
+            file.seek(offset)
+            tail = file.read()
+        size = self.RECORD.size
+        records = len(tail) // size
+        tail = memoryview(tail)[:records * size]
+        if records:
+            # Столбцы хвоста берутся срезами с шагом записи; последняя запись по заказу побеждает
+            order_ids = tail.cast("Q")[::size // 8]
+            top = max(order_ids)
+            if len(self._dense) <= top < 2 * (len(self._dense) + records) + self.DENSE_SLACK:
+                # Хвост достаточно плотный: массив растет сразу до наибольшего номера
+                self._grow(top)
+            for order_id, code in zip(order_ids, tail[17::size]):
+                self._set(order_id, code)
+        return offset, records
+
+    def _get(self, order_id: int) -> int:
+        if order_id < len(self._dense):
+            return self._dense[order_id] - 1
+        return self._sparse.get(order_id, -1)
+
+    def _set(self, order_id: int, code: int):
+        dense = self._dense
+        if len(dense) <= order_id < 2 * len(dense) + self.DENSE_SLACK:
+            self._grow(order_id)
+        if order_id < len(dense):
+            dense[order_id] = code + 1
+        else:
+            self._sparse[order_id] = code
+
+    def _grow(self, order_id: int):
+        start = len(self._dense)
+        size = max(order_id + 1, 2 * start)
+        self._dense.extend(bytes(size - start))
+        # Разреженные номера, которые теперь покрывает массив, переносятся в него
+        for moved in [sparse for sparse in self._sparse if start <= sparse < size]:
+            self._dense[moved] = self._sparse.pop(moved) + 1
+
+    def __len__(self) -> int:
+        """Число заказов, о которых известно журналу"""
+        with self._lock:
+            return len(self._dense) - self._dense.count(0) + len(self._sparse)
+
+    def append(self, order_id: int, source: OrderState, target: OrderState, timestamp: float = None):
+        with self._lock:
+            self._buffer += self.RECORD.pack(order_id, time.time() if timestamp is None else timestamp,
+                                             source.code, target.code)
+            self._set(order_id, target.code)
+            self._pending += 1
+            self._since_snapshot += 1
+            if self._pending >= self.group_size or time.monotonic() - self._last_flush >= self.commit_interval:
+                self._flush()
+            elif self._pending == 1:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="state-log-flusher")
+                    self._flusher.start()
+                self._lock.notify()
+            if self._since_snapshot >= self.snapshot_every:
+                self._snapshot()
+
+    def _flush_loop(self):
+        """Передать буфер ОС не позже commit_interval после предыдущей передачи"""
+        with self._lock:
+            while not self._closed:
+                if not self._pending:
+                    self._lock.wait()
+                    continue
+                remaining = self._last_flush + self.commit_interval - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._file.write(self._buffer)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self._buffer.clear()
+            self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def _snapshot(self):
+        self._flush()
+        temporary = self._snapshot_path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(self.SNAPSHOT_HEADER.pack(self.SNAPSHOT_MAGIC, self._file.tell(), len(self._dense),
+                                                 len(self._sparse)))
+            file.write(self._dense)
+            file.write(array("Q", self._sparse.keys()))
+            file.write(bytes(self._sparse.values()))
+            if self.sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary, self._snapshot_path)
+        self._since_snapshot = 0
+        self.snapshots += 1
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def snapshot(self):
+        """Сохранить снимок немедленно"""
+        with self._lock:
+            self._snapshot()
+
+    def state(self, order_id: int) -> OrderState:
+        with self._lock:
+            code = self._get(order_id)
+        return STATES[code] if code >= 0 else NewState()
+
+    def states(self) -> Tuple[array, "OrderStateArray"]:
+        """Номера известных журналу заказов и их текущие состояния одним массивом в том же порядке"""
+        with self._lock:
+            dense = self._dense
+            if dense.count(0):
+                order_ids = array("Q", (order_id for order_id, code in enumerate(dense) if code))
+                dense = dense.replace(b"\0", b"")
+            else:
+                order_ids = array("Q", range(len(dense)))
+            order_ids.extend(self._sparse.keys())
+            codes = dense.translate(_UNSHIFT) + bytes(self._sparse.values())
+        return order_ids, OrderStateArray.from_codes(codes)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+
+class Order:
+    __slots__ = ("_state", "verbose", "order_id", "occupancy", "journal")
+
+    def __init__(self, verbose: bool = True, order_id: int = None, occupancy: StateOccupancy = None,
+                 journal: OrderStateLog = None):
+        if journal is not None and order_id is None:
+            raise ValueError("Для записи переходов в журнал нужен номер заказа")
         self._state = NewState()
+        self.verbose = verbose
+        self.order_id = order_id
+        # Учет заказов по состояниям и журнал переходов (необязательные)
+        self.occupancy = occupancy
+        self.journal = journal
+        if occupancy is not None:
+            occupancy.track(self)
+
+    @classmethod
+    def restore(cls, order_id: int, journal: OrderStateLog, **options) -> "Order":
+        """Заказ в состоянии, восстановленном из журнала"""
+        order = cls(order_id=order_id, journal=journal, **options)
+        state = journal.state(order_id)
+        if order.occupancy is not None:
+            order.occupancy.untrack(order)
+        order._state = state
+        if order.occupancy is not None:
+            order.occupancy.track(order)
+        return order
 
     def set_state(self, state):
         """Метод для изменения состояния заказа"""
+        previous = self._state
         self._state = state
+        if self.occupancy is not None:
+            self.occupancy.move(self, previous, state)
+        if self.journal is not None:
+            self.journal.append(self.order_id, previous, state)
 
     def process_order(self):
         """Обработать заказ (перевести в следующее состояние)"""
@@ -71,18 +443,193 @@ class Order:
 
     def cancel_order(self):
         """Метод для отмены заказа (доступен не из всех состояний)"""
-        if isinstance(self._state, (NewState, ProcessingState)):
-            self._state = CancelledState()
-            print("Заказ отменен")
-        elif isinstance(self._state, (DeliveredState, CancelledState)):
-            print(f"Невозможно отменить заказ в состоянии '{self._state.get_status()}'")
+        target = TRANSITIONS["cancel"].get(self._state)
+        if target is not None:
+            self.set_state(target)
+            self._state._report(self, "Заказ отменен")
+        elif self._state not in TRANSITIONS["process"]:
+            self._state._report(self, f"Невозможно отменить заказ в состоянии '{self._state.get_status()}'")
         else:
-            print("Отмена возможна только для заказов в состояниях 'Новый' или 'В обработке'")
+            self._state._report(self, "Отмена возможна только для заказов в состояниях 'Новый' или 'В обработке'")
 
     def get_status(self):
         """Получить текущий статус заказа"""
         return self._state.get_status()
 
+    def __repr__(self):
+        return f"Order({self.order_id}, {self.get_status()})"
+
+
+class OrderStateArray:
+    """Состояния множества заказов в компактном массиве: один байт (код состояния) на заказ.
+
+    Массовые переходы advance()/cancel() выполняются по той же таблице TRANSITIONS, но целиком
+    на уровне C: маска накладывается как флаг в битах кода, затем один bytes.translate().
+    """
+    def __init__(self, count: int):
+        self._codes = bytearray(count)
+        # Число заказов по кодам состояний, обновляется при каждом массовом переходе
+        self._counts = [count] + [0] * (len(STATES) - 1)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    @classmethod
+    def from_orders(cls, orders) -> "OrderStateArray":
+        return cls.from_codes(bytearray(order._state.code for order in orders))
+
+    @classmethod
+    def from_codes(cls, codes: bytes) -> "OrderStateArray":
+        states = cls(0)
+        states._codes = bytearray(codes)
+        states._counts = [states._codes.count(state.code) for state in STATES]
+        return states
+
+    @property
+    def codes(self) -> memoryview:
+        return memoryview(self._codes)
+
+    def state(self, index: int) -> OrderState:
+        return STATES[self._codes[index]]
+
+    def get_status(self, index: int) -> str:
+        return self.state(index).get_status()
+
+    def count(self, status: Union[str, OrderState]) -> int:
+        return self._counts[state_for(status).code]
+
+    def counts(self) -> Dict[str, int]:
+        return {state.get_status(): self._counts[state.code] for state in STATES}
+
+    def _apply(self, event: str, mask: Optional[bytes]) -> int:
+        everything, masked, moves = _TABLES[event]
+        if mask is None:
+            moved = {code: self._counts[code] for code in moves}
+            self._codes = self._codes.translate(everything)
+        else:
+            if len(mask) != len(self._codes):
+                raise ValueError(f"Длина маски {len(mask)} не совпадает с числом заказов {len(self._codes)}")
+            # Код и флаг маски объединяются побитовым ИЛИ длинных чисел - без цикла по заказам
+            flags = int.from_bytes(bytes(mask).translate(_MASK_FLAGS), "little")
+            combined = (int.from_bytes(self._codes, "little") | flags).to_bytes(len(self._codes), "little")
+            moved = {code: combined.count(code | MASK_FLAG) for code in moves}
+            self._codes = bytearray(combined.translate(masked))
+        for code, count in moved.items():
+            self._counts[code] -= count
+            self._counts[moves[code]] += count
+        return sum(moved.values())
+
+    def advance(self, mask: bytes = None) -> int:
+        """Перевести отмеченные маской (ненулевой байт) или все заказы в следующее состояние; число переходов"""
+        return self._apply("process", mask)
+
+    def cancel(self, mask: bytes = None) -> int:
+        """Отменить отмеченные заказы, где отмена допустима; число отмененных"""
+        return self._apply("cancel", mask)
+
+
+def benchmark_state_array(count: int = 1000000):
+    """Массовые переходы: объекты Order против OrderStateArray (одинаковые маски и результат)"""
+    generator = random.Random(1)
+    masks = [(event, generator.randbytes(count).translate(bytes([0] * 128 + [1] * 128)))
+             for event in ("process", "cancel", "process", "process", "cancel", "process")]
+
+    orders = [Order(verbose=False) for _ in range(count)]
+    start = time.perf_counter()
+    for event, mask in masks:
+        if event == "process":
+            for order, flag in zip(orders, mask):
+                if flag:
+                    order.process_order()
+        else:
+            for order, flag in zip(orders, mask):
+                if flag:
+                    order.cancel_order()
+    per_object = time.perf_counter() - start
+
+    states = OrderStateArray(count)
+    start = time.perf_counter()
+    for event, mask in masks:
+        if event == "process":
+            states.advance(mask)
+        else:
+            states.cancel(mask)
+    vectorized = time.perf_counter() - start
+
+    assert states.codes.tobytes() == OrderStateArray.from_orders(orders).codes.tobytes()
+    assert states.counts() == OrderStateArray.from_orders(orders).counts()
+    print(f"{count} заказов, {len(masks)} массовых переходов: объекты {per_object:.2f} с, "
+          f"массив {vectorized * 1000:.1f} мс ({per_object / vectorized:.0f}x); итог {states.counts()}")
+
+
+def benchmark_occupancy(count: int = 200000, queries: int = 100):
+    """Ответ "сколько заказов в состоянии" по счетчикам против обхода всех заказов"""
+    generator = random.Random(2)
+    occupancy = StateOccupancy()
+    plain = [Order(verbose=False) for _ in range(count)]
+    tracked = [Order(verbose=False, order_id=number, occupancy=occupancy) for number in range(count)]
+    steps = [generator.randint(0, 3) for _ in range(count)]
+    timings = []
+    for orders in (plain, tracked):
+        start = time.perf_counter()
+        for order, step in zip(orders, steps):
+            for _ in range(step):
+                order.process_order()
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        scanned = sum(1 for order in plain if order.get_status() == "Отправлен")
+    scan = (time.perf_counter() - start) / queries
+    start = time.perf_counter()
+    for _ in range(queries):
+        counted = occupancy.count("Отправлен")
+    counter = (time.perf_counter() - start) / queries
+    assert scanned == counted == len(occupancy.orders("Отправлен"))
+    print(f"{count} заказов: переходы без учета {timings[0]:.2f} с, с учетом {timings[1]:.2f} с; "
+          f"число 'Отправлен' ({counted}): обход {scan * 1000:.1f} мс, счетчик {counter * 1e6:.2f} мкс")
+
+def benchmark_state_log(transitions: int = 10000000, snapshot_every: int = 3000000):
+    """Скорость записи журнала переходов и время восстановления: снимок + хвост против всего журнала"""
+    generator = random.Random(3)
+    orders = -(-transitions // 3)
+    # Каждый заказ проходит Новый -> В обработке -> Отправлен; порядок заказов перемешан волнами
+    waves = [(NewState(), ProcessingState()), (ProcessingState(), ShippedState()), (ShippedState(), DeliveredState())]
+    order_ids = list(range(orders))
+    directory = tempfile.mkdtemp()
+    try:
+        journal = OrderStateLog(directory, snapshot_every=snapshot_every)
+        timestamp = time.time()
+        start = time.perf_counter()
+        written = 0
+        for source, target in waves:
+            generator.shuffle(order_ids)
+            for order_id in order_ids[:transitions - written]:
+                journal.append(order_id, source, target, timestamp)
+            written += min(len(order_ids), transitions - written)
+        journal.close()
+        ingest = time.perf_counter() - start
+        expected = journal.states()[1].counts()
+        size = os.path.getsize(os.path.join(directory, "transitions.log"))
+
+        start = time.perf_counter()
+        recovered = OrderStateLog(directory)
+        with_snapshot = time.perf_counter() - start
+        tail = recovered.replayed
+        assert recovered.states()[1].counts() == expected
+        recovered.close()
+
+        os.remove(os.path.join(directory, "snapshot.bin"))
+        start = time.perf_counter()
+        replayed = OrderStateLog(directory)
+        full = time.perf_counter() - start
+        assert replayed.states()[1].counts() == expected
+        replayed.close()
+    finally:
+        shutil.rmtree(directory)
+    print(f"{written} переходов ({size / 2 ** 20:.0f} МБ журнала, снимков: {journal.snapshots}): запись {ingest:.2f} с "
+          f"({written / ingest:.0f} переходов/с); восстановление: снимок + хвост {tail} записей "
+          f"{with_snapshot:.2f} с, весь журнал {full:.2f} с; итог {expected}")
 
 if __name__ == "__main__":
     order = Order()
@@ -109,11 +656,43 @@ if __name__ == "__main__":
 
     order2.process_order()  # Попытка изменить отмененный заказ
 
+    print("\n--- Учет заказов по состояниям ---")
+    occupancy = StateOccupancy()
+    orders = [Order(verbose=False, order_id=number, occupancy=occupancy) for number in range(1, 6)]
+    for tracked in orders[:3]:
+        tracked.process_order()
+    orders[0].process_order()
+    orders[3].cancel_order()
+    print(f"Отправлено: {occupancy.count('Отправлен')}, в обработке: {occupancy.orders('В обработке')}")
+    print(occupancy.to_prometheus(), end="")
+    benchmark_occupancy()
+
+    print("\n--- Журнал переходов и восстановление ---")
+    with tempfile.TemporaryDirectory() as directory:
+        journal = OrderStateLog(directory)
+        logged = Order(verbose=False, order_id=7, journal=journal)
+        logged.process_order()
+        logged.process_order()
+        journal.close()
+        journal = OrderStateLog(directory)
+        print(f"После перезапуска заказ 7: {Order.restore(7, journal).get_status()}, записей в хвосте: {journal.replayed}")
+        journal.close()
+    benchmark_state_log()
+
+    print("\n--- Массовые переходы ---")
+    states = OrderStateArray(5)
+    states.advance()
+    states.cancel(bytes([1, 0, 0, 0, 0]))
+    states.advance(bytes([0, 1, 1, 0, 0]))
+    print([states.get_status(i) for i in range(len(states))])
+    benchmark_state_array()
+
     '''
     Корректность переходов между состояниями обеспечивается следующими способами:
 
-    1. Логика переходов инкапсулирована в самих классах состояний. Каждый класс состояния
-       определяет, в какое следующее состояние можно перейти, предотвращая недопустимые переходы.
+    1. Допустимые переходы перечислены в одной таблице TRANSITIONS (событие -> из состояния -> в состояние).
+       Ее используют и объекты состояний, и массовые переходы OrderStateArray, поэтому правила
+       не расходятся. Состояния - общие экземпляры без данных (flyweight).
 
     2. Метод process_order() в конечных состояниях (DeliveredState, CancelledState)
        блокирует дальнейшие изменения, выводя сообщение об ошибке.
@@ -129,5 +708,5 @@ if __name__ == "__main__":
 
     Для предотвращения перехода из "Доставлен" в "В обработке":
     - DeliveredState.process_order() не вызывает order.set_state(), а только выводит сообщение
-    - Нет других механизмов изменения состояния из DeliveredState
+    - В TRANSITIONS нет ни одного перехода из DeliveredState, в том числе для массовых операций
     '''
\ No newline at end of file